@@ -0,0 +1,237 @@
+"""Benchmarks of the processing hot paths on synthetic Cengage exports and rosters.
+
+    python benchmark.py                              # default scale, results to benchmark.json
+    python benchmark.py --students 5000 --questions 40 --repeat 5
+    python benchmark.py --compare baseline.json      # exit 1 if a stage got slower
+
+Each run generates a registrar roster and a Cengage export of the requested size in a
+temporary directory, then times every stage on its own, taking the best of --repeat runs.
+Qt runs offscreen, so no display is needed.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from config import Settings
+from processing import EXPORT_ENGINES, Data, Processor, iter_student_rows, read_header, section_table
+
+COMMENT_CODE = '9001'
+DOCUMENTATION_CODE = '9002'
+COURSE_NUMBER = 'CS110'
+
+COMMENTS = ['none', 'None.', 'N/A', 'nothing', 'Nothing so far!', 'nope', '',
+            'The recursion examples were confusing', 'I liked the lab on lists\nbut the quiz was long',
+            'Found the reading on dictionaries useful', 'Still unsure how slicing handles negative steps']
+DOCUMENTATIONS = ['None', 'none.', 'I used the course notes', 'C3C Smith explained loops to me']
+
+def generate_roster(file_path: Path, n_students: int, n_sections: int, n_courses: int = 4, seed: int = 0) -> Path:
+    """Write a registrar roster: a title row, then Course Number/Section/Email/Cadet Name columns.
+
+    The benchmark course holds students 0..n_students-1, the other courses hold as many again
+    so that filtering by course number has real work to do. A .csv path writes the same
+    columns without the title row.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for course in range(n_courses):
+        course_number = COURSE_NUMBER if course == 0 else f'CS{110 + 10 * course}'
+        for i in range(n_students):
+            student = i if course == 0 else n_students * course + i
+            rows.append((f' {course_number} ', f'M{rng.randrange(n_sections) + 1}' if course else f'M{i % n_sections + 1}',
+                         f'C{student:05d}', f' Cadet{student},Test{student} {rng.choice("ABCDEFG")}'))
+
+    df = pd.DataFrame(rows, columns=['Course Number', 'Section', 'Email', 'Cadet Name'])
+    if file_path.suffix == '.csv':
+        df.to_csv(file_path, index=False)
+    else:
+        with pd.ExcelWriter(file_path) as writer:
+            pd.DataFrame([['Class Roster']]).to_excel(writer, index=False, header=False)
+            df.to_excel(writer, index=False, startrow=1)
+
+    return file_path
+
+def generate_export(file_path: Path, n_students: int, n_questions: int, name='Lesson 1 HW', unmatched=0.02, seed: int = 0) -> Path:
+    """Write a Cengage export in the layout Processor.process_header expects.
+
+    The header carries the assignment name, a row of question codes ending with the comment
+    and documentation codes, and a points row. Each student is then an identity row (name,
+    email, free-text answers) followed by a score row (total, then one score per question).
+    A fraction of the students are not on the roster, as happens with dropped cadets.
+    """
+    rng = random.Random(seed)
+    points = [float(rng.choice([1, 2, 3])) for _ in range(n_questions)]
+    codes = [str(1000 + q) for q in range(n_questions)] + [COMMENT_CODE, DOCUMENTATION_CODE]
+    blank = [''] * len(codes)
+
+    with open(file_path, 'w', newline='') as f:
+        f.write('Cengage Learning\n')
+        f.write('Course,CS110 Introduction to Computing\n')
+        f.write('Exported,2024-01-01\n')
+        f.write('\n')
+        f.write(f'Assignment,"{name}"\n')
+        f.write('\n')
+        f.write(','.join(['Name', 'Email', 'Status', 'Total'] + codes) + '\n')
+        f.write(','.join(['', '', '', 'Points'] + [f'{x:g}' for x in points] + ['0', '0']) + '\n')
+        f.write('\n')
+
+        writer = csv.writer(f)
+        for i in range(n_students):
+            email = f'c{i:05d}@usafa.edu' if rng.random() >= unmatched else f'x{i:05d}@usafa.edu'
+            identity = [f'Cadet{i},Test{i} A', email, 'Submitted', ''] + blank
+            identity[-2] = rng.choice(COMMENTS)
+            identity[-1] = rng.choice(DOCUMENTATIONS)
+
+            scores = [rng.choice([0.0, x, x, x, x / 2]) for x in points]
+            writer.writerow(identity)
+            # The comment and documentation questions are worth nothing, so Cengage scores them 0
+            writer.writerow(['', '', '', f'{sum(scores):g}'] + scores + ['0', '0'])
+
+    return file_path
+
+def time_stage(fn, repeat: int) -> tuple[float, object]:
+    """Best wall time of repeat calls to fn, and the result of the last call."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+def run(args) -> dict:
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        roster_path = generate_roster(tmp / 'roster.xlsx', args.students, args.sections, seed=args.seed)
+        export_path = generate_export(tmp / 'export.csv', args.students, args.questions, seed=args.seed)
+
+        settings = Settings(commentCode=COMMENT_CODE, documentationCode=DOCUMENTATION_CODE, courseNumber=COURSE_NUMBER, cache_directory=None)
+        processor = Processor(settings)
+
+        stages['load_roster'], roster = time_stage(lambda: processor.load_roster(roster_path), args.repeat)
+        csv_path = generate_roster(tmp / 'roster.csv', args.students, args.sections, seed=args.seed)
+        stages['load_roster_csv'], registrar = time_stage(lambda: processor.read_registrar(csv_path), args.repeat)
+        settings.set_registrar(registrar)
+        stages['select_course'], _ = time_stage(lambda: settings.select_course(COURSE_NUMBER), args.repeat)
+        settings.set_roster(roster)
+
+        with open(export_path, 'r', newline='') as f:
+            header = read_header(f, settings.header_length)
+        stages['process_header'], _ = time_stage(lambda: processor.process_header(Data(header_data=header)), args.repeat)
+
+        def parse():
+            with open(export_path, 'r', newline='') as f:
+                data = processor.process_header(Data(header_data=read_header(f, settings.header_length), raw_data=iter_student_rows(f)))
+                return processor.parse_data(data)
+
+        stages['parse_data'], asst_data = time_stage(parse, args.repeat)
+
+        stages['comment_triage'], triage = time_stage(lambda: processor.triage_comments(asst_data), args.repeat)
+
+        def generate_tables():
+            wb = openpyxl.Workbook()
+            for section, rows in asst_data.section_rows.items():
+                processor.generate_excel_table(section_table(asst_data, section), wb.create_sheet(section), asst_data.name, triage.section(rows))
+
+        stages['generate_excel_table'], _ = time_stage(generate_tables, args.repeat)
+
+        for engine in args.engines:
+            options = dict(engine='fast', parallel=True) if engine == 'parallel' else dict(engine=engine, parallel=False)
+            # A fresh directory per repeat, so every repeat writes a new workbook rather than updating the last one
+            runs = itertools.count()
+            stages[f'export_{engine}'], _ = time_stage(lambda: processor.export(asst_data, tmp / engine / str(next(runs)), incremental=False, per_section=False, **options), args.repeat)
+        processor.close()
+
+        if not args.no_gui:
+            stages['populate_data_view'] = time_populate(asst_data, args.repeat)
+
+    return {
+        'scale': {'students': args.students, 'questions': args.questions, 'sections': args.sections, 'seed': args.seed, 'repeat': args.repeat},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__,
+                        'pandas': pd.__version__, 'openpyxl': openpyxl.__version__},
+        'stages': stages,
+    }
+
+def time_populate(asst_data: Data, repeat: int) -> float:
+    from PyQt5.QtWidgets import QApplication, QTableView
+    from table_model import AssignmentTableModel
+
+    app = QApplication.instance() or QApplication([])
+    view = QTableView()
+    view.show()
+
+    def populate():
+        view.setModel(AssignmentTableModel(asst_data, view))
+        app.processEvents()
+
+    seconds, _ = time_stage(populate, repeat)
+    view.close()
+
+    return seconds
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Print each stage against the baseline; True if any stage is slower than tolerance allows."""
+    slower = False
+    if baseline.get('scale') != results['scale']:
+        print(f'warning: baseline scale {baseline.get("scale")} differs from {results["scale"]}', file=sys.stderr)
+
+    for stage, seconds in results['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before is None:
+            print(f'{stage:<22}{seconds * 1000:10.1f} ms   (new)')
+            continue
+
+        ratio = seconds / before if before else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  SLOWER'
+            slower = True
+        print(f'{stage:<22}{seconds * 1000:10.1f} ms   {before * 1000:10.1f} ms   x{ratio:.2f}{flag}')
+
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the processing stages on synthetic data.')
+    parser.add_argument('--students', type=int, default=2000, help='students in the export and the benchmark course')
+    parser.add_argument('--questions', type=int, default=30, help='graded questions per student')
+    parser.add_argument('--sections', type=int, default=8, help='sections the students are spread across')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the synthetic data')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the best is reported')
+    parser.add_argument('--engines', nargs='*', choices=EXPORT_ENGINES + ('parallel',), default=['fast', 'legacy'],
+                        help='export engines to time (default: fast legacy)')
+    parser.add_argument('--no-gui', action='store_true', help='skip the offscreen data view stage')
+    parser.add_argument('--output', default='benchmark.json', help='where to write the results')
+    parser.add_argument('--compare', metavar='BASELINE', help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before a stage is flagged (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.tolerance) else 0
+
+    for stage, seconds in results['stages'].items():
+        print(f'{stage:<22}{seconds * 1000:10.1f} ms')
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""On-disk cache of parsed assignments.
+
+Entries are single .npz files holding the columnar arrays of a parsed export plus a JSON
+metadata record, named by a key derived from the export's content and the settings that
+affect parsing. Hits refresh the entry's modification time, and the least recently used
+entries are evicted once the directory grows past its size budget.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+
+def file_digest(file_path, chunk_size=2**20) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+class AssignmentCache:
+    def __init__(self, directory='cache', max_bytes=256 * 2**20):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f'{key}.npz'
+
+    def get(self, key: str) -> tuple[dict, dict[str, np.ndarray]]:
+        """Return (metadata, arrays) for key, or None on a miss or an unreadable entry."""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+            meta = json.loads(str(arrays.pop('__meta__')))
+            os.utime(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+        return meta, arrays
+
+    def put(self, key: str, meta: dict, arrays: dict[str, np.ndarray]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, __meta__=np.array(json.dumps(meta)), **arrays)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob('*.npz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.directory.glob('*.npz'):
+            path.unlink(missing_ok=True)
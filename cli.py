@@ -0,0 +1,183 @@
+"""Headless batch processing of Cengage exports.
+
+    python cli.py exports/                 # every *.csv in a directory
+    python cli.py "exports/lesson*.csv"    # a glob
+    python cli.py a.csv b.csv --workers 4
+    python cli.py --summary                # semester summaries from the gradebook only
+    python cli.py downloads/ --watch       # keep processing exports as they land in a folder
+    python cli.py hw1.csv hw1_late.csv --merge --keep highest
+
+Uses the roster and codes saved from the GUI and writes output/<assignment>/output.xlsx
+for each assignment, processing assignments in parallel across worker processes. With
+--merge, the exports of each assignment are merged into one row per cadet and exported once,
+redrawing only the rows that changed since the last export.
+"""
+import argparse
+import glob
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from config import SETTINGS_PATH, Settings
+from gradebook import Gradebook
+from processing import EXPORT_ENGINES, MERGE_POLICIES, Processor
+from profiling import PROFILE_MODES, Trace
+from watch import WATCH_STATE, FolderWatcher, process_ready
+
+
+def collect_files(sources: list[str]) -> list[Path]:
+    files = []
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            files.extend(sorted(path.glob('*.csv')))
+        elif path.is_file():
+            files.append(path)
+        else:
+            files.extend(Path(x) for x in sorted(glob.glob(source)))
+
+    # Keep the first occurrence of any file matched more than once
+    return list(dict.fromkeys(files))
+
+def group_by_assignment(settings: Settings, files: list[Path]) -> dict[str, list[Path]]:
+    # Exports of the same assignment write the same workbook, so they must share a worker
+    processor = Processor(settings)
+    groups = {}
+    for file_path in files:
+        name = processor.read_header(file_path).name
+        groups.setdefault(name, []).append(file_path)
+
+    return groups
+
+def process_assignment(settings: Settings, files: list[Path], output_root: str, export_options: dict,
+                       merge: bool = False) -> list[tuple[str, Path, list[str]]]:
+    processor = Processor(settings)
+    gradebook = Gradebook(settings.gradebook_directory) if settings.gradebook_directory else None
+    results = []
+
+    try:
+        if merge and len(files) > 1:
+            trace = Trace()
+            asst_data = processor.merge_files(files, trace=trace)
+            if gradebook:
+                with processor.stage('gradebook', trace):
+                    gradebook.append(asst_data)
+            # Merged exports redraw only the rows that changed unless incremental export is turned off
+            export_options = dict(export_options, incremental=export_options['incremental'] is not False)
+            return [(' + '.join(map(str, files)), processor.export(asst_data, output_root, trace=trace, **export_options), asst_data.unmatched)]
+
+        for file_path in files:
+            trace = Trace()
+            asst_data = processor.load_file(file_path, trace=trace)
+            if gradebook:
+                with processor.stage('gradebook', trace):
+                    gradebook.append(asst_data)
+            results.append((file_path, processor.export(asst_data, output_root, trace=trace, **export_options), asst_data.unmatched))
+    finally:
+        processor.close()
+
+    return results
+
+def watch(settings: Settings, directory: Path, output_root: str, export_options: dict) -> int:
+    processor = Processor(settings)
+    gradebook = Gradebook(settings.gradebook_directory) if settings.gradebook_directory else None
+    watcher = FolderWatcher(directory, Path(output_root) / WATCH_STATE, settings.watch_settle)
+    print(f'Watching {directory}, press Ctrl+C to stop')
+
+    try:
+        while True:
+            for file_path, output_path in process_ready(processor, watcher, watcher.settled(), output_root, gradebook, **export_options):
+                print(f'{file_path} -> {output_path}')
+            time.sleep(settings.watch_interval)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        processor.close()
+
+def configure_logging(level):
+    # Also the worker initializer, so spawned workers log stage timings the same way
+    logging.basicConfig(level=level, format='%(asctime)s %(processName)s %(name)s: %(message)s')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Process Cengage CSV exports without the GUI.')
+    parser.add_argument('sources', nargs='*', help='CSV files, directories or glob patterns')
+    parser.add_argument('--settings', default=SETTINGS_PATH, help='settings file saved by the GUI')
+    parser.add_argument('--output', default='output', help='root directory for the output workbooks')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--engine', choices=EXPORT_ENGINES, default=None, help='export engine (default: from settings)')
+    parser.add_argument('--incremental', action=argparse.BooleanOptionalAction, default=None,
+                        help='only rewrite sections whose content changed (default: from settings)')
+    parser.add_argument('--parallel-sections', dest='parallel', action=argparse.BooleanOptionalAction, default=None,
+                        help='render the sections of each assignment in separate processes (default: from settings)')
+    parser.add_argument('--no-cache', action='store_true', help='always re-parse exports instead of using the parsed-assignment cache')
+    parser.add_argument('--per-section', action=argparse.BooleanOptionalAction, default=None,
+                        help='write one workbook per section instead of output.xlsx (default: from settings)')
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=None,
+                        help='record per-stage memory (tracemalloc) or function profiles (cprofile) in each trace (default: from settings)')
+    parser.add_argument('--summary', action='store_true',
+                        help='write per-cadet and per-section summaries of the gradebook to <output>/summary.xlsx, after processing any sources')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep watching the source directory (default: settings.watch_directory), processing new or changed exports')
+    parser.add_argument('--merge', action='store_true',
+                        help='merge the exports of each assignment into one row per cadet before exporting, instead of exporting each in turn')
+    parser.add_argument('--keep', choices=MERGE_POLICIES, default=None,
+                        help="row kept per cadet when merging: the newest export's or the highest total (default: from settings)")
+    parser.add_argument('-v', '--verbose', action='store_true', help='log the timing of every stage')
+    args = parser.parse_args(argv)
+
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    configure_logging(log_level)
+
+    settings = Settings.load(args.settings)
+    if settings.roster is None:
+        print('No roster found, load one from the GUI first.', file=sys.stderr)
+        return 1
+    if args.no_cache:
+        settings.cache_directory = None
+    if args.profile:
+        settings.profile_mode = args.profile
+    if args.keep:
+        settings.merge_policy = args.keep
+    export_options = dict(engine=args.engine, incremental=args.incremental, parallel=args.parallel, per_section=args.per_section)
+
+    if args.watch:
+        directory = args.sources[0] if args.sources else settings.watch_directory
+        if len(args.sources) > 1 or not directory or not Path(directory).is_dir():
+            print('--watch takes a single directory to watch.', file=sys.stderr)
+            return 1
+        return watch(settings, Path(directory), args.output, export_options)
+
+    files = collect_files(args.sources)
+    if not files and not args.summary:
+        print('No CSV exports found.', file=sys.stderr)
+        return 1
+
+    groups = group_by_assignment(settings, files)
+    failures = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=configure_logging, initargs=(log_level,)) as pool:
+        futures = {pool.submit(process_assignment, settings, group, args.output, export_options, args.merge): name for name, group in groups.items()}
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                failures += 1
+                print(f'{name}: failed ({e})', file=sys.stderr)
+                continue
+
+            for file_path, output_path, unmatched in results:
+                note = f' ({len(unmatched)} not on roster)' if unmatched else ''
+                print(f'{file_path} -> {output_path}{note}')
+
+    if args.summary:
+        gradebook = Gradebook(settings.gradebook_directory or 'gradebook')
+        print(f'Summary -> {gradebook.export_summary(Path(args.output) / "summary.xlsx")}')
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
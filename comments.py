@@ -0,0 +1,101 @@
+"""Comment triage for the copy-and-paste comment block.
+
+Run once per assignment over the whole comment column: each comment is normalized (case
+folded, runs of whitespace collapsed to one space, punctuation stripped from the ends),
+comments whose normalized text is only filler ("none", "N/A.", "nothing!") are dropped, and
+comments that normalize to the same text as an earlier one in their section are collapsed
+into it, by hashing the normalized text. Punctuation and symbols inside a comment are kept,
+so "C++ was hard" and "C was hard" stay apart, as do "-1" and "1". The truncated or padded
+cells of the comment and documentation columns are computed in the same pass, so each
+section's sheet only slices the results.
+"""
+import re
+import string
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+COMMENT_WIDTH = 95
+DOCUMENTATION_WIDTH = 40
+
+# ASCII and Latin-1 punctuation and the General Punctuation block; symbols such as emoji are not punctuation
+PUNCTUATION = re.escape(string.punctuation) + '¡¿«»·\u2010-\u2027\u2030-\u205e'
+# Signs are kept at the start so "-1" stays apart from "1"
+LEADING_PUNCTUATION = PUNCTUATION.replace(re.escape('+'), '').replace(re.escape('-'), '')
+
+# Removed from each comment after case folding and collapsing whitespace
+NORMALIZE_PATTERN = rf'^[{LEADING_PUNCTUATION}\s]+|[{PUNCTUATION}\s]+$'
+
+# Comments made of nothing but these may be dropped as filler even though they normalize to ''
+BLANK_PATTERN = rf'[{PUNCTUATION}\s]*'
+
+# A comment is filler when its whole normalized text matches one of these
+FILLER_PATTERNS = [
+    r'',
+    r'n/?a',
+    r'no|nope|nah|negative',
+    r'(none|nothing)(\W+(yet|so far|for now|really|at this time|at the moment))?',
+    r'no comments?(\W+(yet|so far|for now))?',
+    r'nothing (to (add|report|say)|comes to mind)',
+]
+
+def truncate_or_pad(values: pd.Series, max_length: int) -> pd.Series:
+    """Truncate to max_length with '...', or pad to it with spaces, over a whole column."""
+    values = values.astype(str)
+    long = values.str.len() > max_length
+
+    return (values.str.slice(0, max_length - 3) + '...').where(long, values.str.ljust(max_length))
+
+@dataclass
+class CommentTriage:
+    """Comment and documentation cells of an assignment, and the comments listed below each section."""
+    text: np.ndarray = None
+    cells: np.ndarray = None
+    documentation_cells: np.ndarray = None
+    pasted: np.ndarray = None
+
+    def section(self, rows: slice) -> 'CommentTriage':
+        return CommentTriage(*(None if values is None else values[rows] for values in (self.text, self.cells, self.documentation_cells, self.pasted)))
+
+    def paste_block(self) -> list[str]:
+        return [] if self.text is None else self.text[self.pasted].tolist()
+
+class CommentFilter:
+    def __init__(self, filler_patterns: list[str] = None, normalize_pattern: str = None):
+        filler_patterns = FILLER_PATTERNS if filler_patterns is None else filler_patterns
+        self.normalize = re.compile(normalize_pattern or NORMALIZE_PATTERN, re.UNICODE)
+        self.whitespace = re.compile(r'\s+', re.UNICODE)
+        self.blank = re.compile(BLANK_PATTERN, re.UNICODE)
+        # (?!) never matches, for an empty pattern list
+        self.filler = re.compile('|'.join(f'(?:{pattern})' for pattern in filler_patterns) or '(?!)', re.UNICODE)
+
+    def normalized(self, comments: pd.Series) -> pd.Series:
+        collapsed = comments.str.casefold().str.replace(self.whitespace, ' ', regex=True)
+
+        return collapsed.str.replace(self.normalize, '', regex=True)
+
+    def triage(self, comments=None, documentations=None, sections=None) -> CommentTriage:
+        """Triage whole columns; sections, if given, holds each row's section code for collapsing duplicates."""
+        triage = CommentTriage()
+
+        if documentations is not None:
+            triage.documentation_cells = truncate_or_pad(pd.Series(documentations, dtype=object), DOCUMENTATION_WIDTH).to_numpy(dtype=object)
+
+        if comments is None:
+            return triage
+
+        text = pd.Series(comments, dtype=object).fillna('').astype(str)
+        normalized = self.normalized(text)
+        # Whatever a normalize pattern strips, a comment with any real content in it is never filler for being empty
+        filler = (normalized.str.fullmatch(self.filler) & ((normalized != '') | text.str.fullmatch(self.blank))).to_numpy(dtype=bool)
+        # Comments a normalize pattern empties are only duplicates of the same raw text
+        keys = pd.util.hash_array(normalized.where(normalized != '', text).to_numpy(dtype=object))
+        sections = np.zeros(len(text), dtype=np.int64) if sections is None else np.asarray(sections)
+        repeated = pd.DataFrame({'section': sections, 'key': keys}).duplicated().to_numpy()
+
+        triage.text = text.to_numpy(dtype=object)
+        triage.cells = truncate_or_pad(text, COMMENT_WIDTH).to_numpy(dtype=object)
+        triage.pasted = ~filler & ~repeated
+
+        return triage
@@ -0,0 +1,312 @@
+"""Application settings and the roster they carry.
+
+Kept apart from processing.py so the GUI can read its settings at startup without importing
+pandas, NumPy or openpyxl; those are imported inside the functions that need them, the first
+time the roster is actually used.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class RosterIndex:
+    """Roster lookup keyed on normalized email, holding (section, name) per cadet."""
+    entries: dict[str, tuple[str, str]] = field(default_factory=dict)
+    fingerprint: str = ''
+
+    @staticmethod
+    def normalize_email(email) -> str:
+        return str(email).strip().lower().split('@')[0]
+
+    @classmethod
+    def from_roster(cls, roster: pd.DataFrame):
+        import pandas as pd
+
+        fingerprint = hashlib.sha256(pd.util.hash_pandas_object(roster, index=False).to_numpy().tobytes()).hexdigest()
+
+        roster = roster[roster['Email'].notna()]
+        emails = roster['Email'].astype(str).str.strip().str.lower().str.split('@').str[0]
+
+        entries = {}
+        for email, section, name in zip(emails, roster['Section'], roster['Cadet Name']):
+            # First occurrence wins, matching the previous iloc[0] behavior
+            entries.setdefault(email, (section, name))
+
+        return cls(entries, fingerprint)
+
+    def lookup(self, email):
+        return self.entries.get(self.normalize_email(email))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, email):
+        return self.normalize_email(email) in self.entries
+
+SETTINGS_PATH = 'settings/settings.json'
+ROSTER_COLUMNS = ['Section', 'Email', 'Cadet Name']
+LEGACY_SETTINGS_NAME = 'settings.pkl'
+
+class _SettingsUnpickler(pickle.Unpickler):
+    # Settings pickled before config.py existed reference the classes through __main__ or processing
+    def find_class(self, module, name):
+        if module in ('__main__', 'processing') and name in ('Settings', 'RosterIndex'):
+            module = __name__
+        elif module == '__main__' and name == 'Data':
+            module = 'processing'
+        return super().find_class(module, name)
+
+def save_roster_store(file_path: Path, roster: pd.DataFrame):
+    """Store the roster columns as NumPy arrays, so reading it back needs neither pickle nor Excel."""
+    import numpy as np
+
+    arrays = {}
+    for column in roster.columns:
+        values = roster[column].to_numpy()
+        arrays[column] = values.astype(str) if values.dtype == object else values
+
+    # Written under a temporary name first so an interrupted save never leaves a partial roster
+    tmp_path = file_path.with_suffix('.tmp.npz')
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, file_path)
+
+def load_roster_store(file_path: Path) -> pd.DataFrame:
+    import numpy as np
+    import pandas as pd
+
+    try:
+        with np.load(file_path, allow_pickle=False) as store:
+            columns = {name: store[name] for name in store.files}
+    except FileNotFoundError:
+        return None
+
+    return pd.DataFrame({name: values.astype(object) if values.dtype.kind == 'U' else values for name, values in columns.items()})
+
+def load_roster_listing(file_path: Path) -> list[str]:
+    """'Name (Section)' for each cadet of a roster store, read with NumPy alone."""
+    import numpy as np
+
+    try:
+        with np.load(file_path, allow_pickle=False) as store:
+            names, sections = store['Cadet Name'].tolist(), store['Section'].tolist()
+    except FileNotFoundError:
+        return None
+
+    return [f'{name} ({section})' for name, section in zip(names, sections)]
+
+@dataclass
+class Settings:
+    """Settings saved as a small JSON file, with the roster stored beside it and loaded on first use.
+
+    The registrar file the roster came from is stored the same way with every course in it,
+    so changing courseNumber only has to select another course's rows.
+    """
+    commentCode: str = None
+    documentationCode: str = None
+    courseNumber: str = None
+    header_length: int = 9
+    asst_name_idx: int = 4
+    asst_points_idx: int = 7
+    export_engine: str = 'fast'
+    incremental_export: bool = False
+    parallel_export: bool = False
+    workbook_per_section: bool = False
+    cache_directory: str = 'cache'
+    cache_max_mb: int = 256
+    gradebook_directory: str = 'gradebook'
+    profile_mode: str = None
+    watch_directory: str = None
+    watch_interval: float = 2.0
+    watch_settle: float = 2.0
+    merge_policy: str = 'newest'
+    # None uses the defaults in comments.py
+    comment_filler_patterns: list[str] = None
+    comment_normalize_pattern: str = None
+    
+    output_directory: str = None
+
+    def __post_init__(self):
+        self._path = Path(SETTINGS_PATH)
+        self._roster = None
+        self._roster_loaded = True
+        self._roster_dirty = False
+        self._saved_config = None
+        self._roster_index = None
+        self._indexed_roster = None
+        self._registrar = None
+        self._registrar_loaded = True
+        self._registrar_dirty = False
+        self._course_index = None
+
+    def __getstate__(self):
+        # The roster index is derived data, rebuild it on load instead of pickling it
+        self.roster
+        state = self.__dict__.copy()
+        state.pop('_roster_index', None)
+        state.pop('_indexed_roster', None)
+        state.pop('_course_index', None)
+        # Worker processes only need the selected roster, a copy never saves the registrar
+        state.update(_registrar=None, _registrar_loaded=False, _registrar_dirty=False)
+        return state
+
+    def __setstate__(self, state):
+        # Pickles written before the JSON settings stored the roster as a plain attribute
+        legacy = 'roster' in state
+        roster = state.pop('roster', None)
+
+        self.__post_init__()
+        self.__dict__.update(state)
+        if legacy:
+            self._roster = roster
+            self._roster_dirty = roster is not None
+
+    @property
+    def roster_path(self) -> Path:
+        return self._path.with_name('roster.npz')
+
+    @property
+    def roster(self) -> pd.DataFrame:
+        if not self._roster_loaded:
+            self._roster = load_roster_store(self.roster_path)
+            self._roster_loaded = True
+        return self._roster
+
+    @property
+    def has_roster(self) -> bool:
+        # Checks the store while the roster is not loaded, so asking does not import pandas
+        return self._roster is not None if self._roster_loaded else self.roster_path.exists()
+
+    def roster_listing(self) -> list[str]:
+        if not self._roster_loaded:
+            return load_roster_listing(self.roster_path)
+        if self._roster is None:
+            return None
+        return [f'{name} ({section})' for name, section in zip(self._roster['Cadet Name'], self._roster['Section'])]
+
+    @property
+    def roster_index(self) -> RosterIndex:
+        if self.roster is None:
+            return None
+        if self._roster_index is None or self._indexed_roster is not self.roster:
+            self._roster_index = RosterIndex.from_roster(self.roster)
+            self._indexed_roster = self.roster
+        return self._roster_index
+
+    def set_roster(self, roster: pd.DataFrame):
+        self._roster = roster
+        self._roster_loaded = True
+        self._roster_dirty = True
+        self._roster_index = None
+        self._indexed_roster = None
+        self.roster_index
+
+    @property
+    def registrar_path(self) -> Path:
+        return self._path.with_name('registrar.npz')
+
+    @property
+    def registrar(self) -> pd.DataFrame:
+        if not self._registrar_loaded:
+            self._registrar = load_roster_store(self.registrar_path)
+            self._registrar_loaded = True
+        return self._registrar
+
+    @property
+    def has_registrar(self) -> bool:
+        return self._registrar is not None if self._registrar_loaded else self.registrar_path.exists()
+
+    def set_registrar(self, registrar: pd.DataFrame):
+        self._registrar = registrar
+        self._registrar_loaded = True
+        self._registrar_dirty = True
+        self._course_index = None
+
+    @property
+    def course_index(self) -> dict:
+        """Row positions in the registrar of each course number."""
+        if self.registrar is None:
+            return {}
+        if self._course_index is None:
+            self._course_index = self.registrar.groupby('Course Number', sort=True).indices
+        return self._course_index
+
+    def courses(self) -> list[str]:
+        return list(self.course_index)
+
+    def select_course(self, course_number) -> bool:
+        """Make the course's students the roster; False if the registrar has no such course."""
+        rows = self.course_index.get(course_number)
+        if rows is None:
+            return False
+
+        self.courseNumber = course_number
+        self.set_roster(self.registrar.iloc[rows][ROSTER_COLUMNS].reset_index(drop=True))
+        return True
+
+    def config(self) -> dict:
+        return asdict(self)
+
+    def save(self, filepath=None):
+        """Write whichever of the JSON config and the roster store changed since the last save."""
+        if filepath is not None and Path(filepath) != self._path:
+            self.registrar
+            self._path = Path(filepath)
+            self._saved_config = None
+            self._roster_dirty = self.roster is not None
+            self._registrar_dirty = self._registrar is not None
+
+        config = self.config()
+        if config != self._saved_config:
+            with open(self._path, 'w') as f:
+                json.dump(config, f, indent=4)
+            self._saved_config = config
+
+        if self._roster_dirty:
+            save_roster_store(self.roster_path, self._roster)
+            self._roster_dirty = False
+        if self._registrar_dirty:
+            save_roster_store(self.registrar_path, self._registrar)
+            self._registrar_dirty = False
+
+    @classmethod
+    def load(cls, filepath=SETTINGS_PATH):
+        filepath = Path(filepath)
+        try:
+            with open(filepath, 'r') as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            return cls._migrate_pickle(filepath)
+
+        known = {x.name for x in fields(cls)}
+        settings = cls(**{key: value for key, value in config.items() if key in known})
+        settings._path = filepath
+        settings._saved_config = config
+        settings._roster_loaded = False
+        settings._registrar_loaded = False
+
+        return settings
+
+    @classmethod
+    def _migrate_pickle(cls, filepath: Path):
+        # Convert settings.pkl from earlier versions to the JSON config and roster store
+        try:
+            with open(filepath.with_name(LEGACY_SETTINGS_NAME), 'rb') as f:
+                settings = _SettingsUnpickler(f).load()
+        except FileNotFoundError:
+            settings = cls()
+            settings._path = filepath
+            return settings
+
+        settings._path = filepath
+        settings.save()
+        return settings
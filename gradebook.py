@@ -0,0 +1,191 @@
+"""Semester gradebook built from every parsed assignment.
+
+Each parsed assignment is appended as one segment: an .npz file of per-cadet columns
+(assignment, email, name, section, total and outcome counts) and the cadets' int8 outcome
+code per question, named by a digest of its content so re-loading the same export adds no
+new segment. When an assignment is appended again with different results, the newest
+segment wins for each (assignment, email) pair on read; appending results already stored
+rewrites their segment as the newest.
+
+The summaries are group-bys over the concatenated segments, so they never touch the exports
+or workbooks the assignments came from.
+"""
+import hashlib
+import os
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from processing import OUTCOME_FULL, OUTCOME_PARTIAL, OUTCOME_MISSING, OUTCOME_ANOMALOUS, Data, graded_questions
+
+# Bump whenever the segment columns change; segments of versions not listed as readable are ignored
+GRADEBOOK_VERSION = 2
+# Version 1 segments have no outcome matrix, but still count towards the summaries
+READABLE_VERSIONS = (1, 2)
+
+TEXT_COLUMNS = ('assignment', 'email', 'name', 'section')
+SUMMARY_COLUMNS = (*TEXT_COLUMNS, 'total', 'possible', 'questions', 'full', 'partial', 'missing', 'anomalous', 'appended')
+
+def assignment_records(asst_data: Data) -> dict[str, np.ndarray]:
+    """Per-cadet columns and the outcome matrix of one parsed assignment, in final_data row order."""
+    final_data = asst_data.final_data
+    n_students = len(final_data)
+    n_graded = graded_questions(asst_data)
+    outcomes = asst_data.outcomes
+
+    return {
+        'assignment': np.full(n_students, asst_data.name.strip('"')),
+        'email': final_data['Email'].to_numpy().astype(str),
+        'name': final_data['Name'].to_numpy().astype(str),
+        'section': final_data['Section'].to_numpy().astype(str),
+        'total': np.asarray(asst_data.totals, dtype=float),
+        'possible': np.full(n_students, float(sum(asst_data.points[:n_graded]))),
+        'questions': np.full(n_students, n_graded, dtype=np.int32),
+        'full': np.count_nonzero(outcomes == OUTCOME_FULL, axis=1).astype(np.int32),
+        'partial': np.count_nonzero(outcomes == OUTCOME_PARTIAL, axis=1).astype(np.int32),
+        'missing': np.count_nonzero(outcomes == OUTCOME_MISSING, axis=1).astype(np.int32),
+        'anomalous': np.count_nonzero(outcomes == OUTCOME_ANOMALOUS, axis=1).astype(np.int32),
+        'outcomes': np.asarray(outcomes[:, :n_graded], dtype=np.int8),
+    }
+
+class Gradebook:
+    def __init__(self, directory='gradebook'):
+        self.directory = Path(directory)
+
+    def append(self, asst_data: Data) -> bool:
+        """Add a parsed assignment as a new segment; False if identical results were already stored.
+
+        Identical results are rewritten with a new appended time, so they win over any other
+        results stored for the assignment since.
+        """
+        records = assignment_records(asst_data)
+
+        digest = hashlib.sha256(str(GRADEBOOK_VERSION).encode())
+        for name, values in records.items():
+            digest.update(name.encode())
+            digest.update(values.tobytes())
+        path = self.directory / f'{digest.hexdigest()}.npz'
+        stored = path.exists()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Appended time orders the assignments and decides which segment wins for a repeated assignment
+        appended = np.full(len(records['email']), time.time_ns(), dtype=np.int64)
+        version = np.array(GRADEBOOK_VERSION)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, __version__=version, appended=appended, **records)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        return not stored
+
+    def segments(self, names=SUMMARY_COLUMNS) -> list[dict[str, np.ndarray]]:
+        """The given arrays of every readable segment that has all of them."""
+        segments = []
+        for path in self.directory.glob('*.npz'):
+            try:
+                with np.load(path, allow_pickle=False) as segment:
+                    if int(segment['__version__']) not in READABLE_VERSIONS:
+                        continue
+                    segments.append({name: segment[name] for name in names})
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                continue
+
+        return segments
+
+    def load(self) -> pd.DataFrame:
+        """Every stored result, keeping the newest segment's row per (assignment, email)."""
+        segments = self.segments()
+        if not segments:
+            return pd.DataFrame(columns=list(SUMMARY_COLUMNS))
+
+        columns = {name: np.concatenate([segment[name] for segment in segments]) for name in SUMMARY_COLUMNS}
+        df = pd.DataFrame(columns)
+        for name in TEXT_COLUMNS:
+            df[name] = df[name].astype(object)
+
+        df = df.sort_values('appended', kind='stable').drop_duplicates(['assignment', 'email'], keep='last')
+        return df.reset_index(drop=True)
+
+    def final_data(self, assignment: str) -> pd.DataFrame:
+        """One assignment's stored results shaped like its final_data: Name, Email, Section, Total and Q1..Qn outcome codes.
+
+        Keeps the newest segment's row per email; segments without an outcome matrix are skipped.
+        """
+        segments = [segment for segment in self.segments(('assignment', 'email', 'name', 'section', 'total', 'appended', 'outcomes'))
+                    if len(segment['assignment']) and segment['assignment'][0] == assignment]
+        if not segments:
+            return pd.DataFrame(columns=['Name', 'Email', 'Section', 'Total'])
+
+        # The newest segment sets the questions; older segments with a different set are left out
+        segments.sort(key=lambda segment: segment['appended'][0])
+        n_questions = segments[-1]['outcomes'].shape[1]
+        segments = [segment for segment in segments if segment['outcomes'].shape[1] == n_questions]
+
+        rows = pd.DataFrame({
+            'Name': np.concatenate([segment['name'] for segment in segments]).astype(object),
+            'Email': np.concatenate([segment['email'] for segment in segments]).astype(object),
+            'Section': np.concatenate([segment['section'] for segment in segments]).astype(object),
+            'Total': np.concatenate([segment['total'] for segment in segments]),
+        })
+        outcomes = np.concatenate([segment['outcomes'] for segment in segments])
+        for x in range(n_questions):
+            rows[f'Q{x + 1}'] = outcomes[:, x]
+
+        rows = rows.drop_duplicates('Email', keep='last').reset_index(drop=True)
+        rows['Section'] = rows['Section'].astype('category')
+
+        return rows
+
+    def summaries(self) -> dict[str, pd.DataFrame]:
+        """Per-cadet and per-section summaries, plus each cadet's total per assignment in appended order."""
+        df = self.load()
+        df['answered'] = df['full'] + df['partial']
+
+        cadets = df.groupby('email', sort=True).agg(
+            Name=('name', 'last'), Section=('section', 'last'), Assignments=('assignment', 'nunique'),
+            answered=('answered', 'sum'), partial=('partial', 'sum'), questions=('questions', 'sum'),
+            Total=('total', 'sum'), Possible=('possible', 'sum'))
+
+        sections = df.groupby('section', sort=True).agg(
+            Cadets=('email', 'nunique'), Assignments=('assignment', 'nunique'),
+            answered=('answered', 'sum'), partial=('partial', 'sum'), questions=('questions', 'sum'),
+            **{'Mean Total': ('total', 'mean')}, Total=('total', 'sum'), Possible=('possible', 'sum'))
+
+        for summary in (cadets, sections):
+            questions = summary['questions'].where(summary['questions'] > 0)
+            summary['Completion Rate'] = summary['answered'] / questions
+            summary['Partial Credit Rate'] = summary['partial'] / questions
+            summary['Score'] = summary['Total'] / summary['Possible'].where(summary['Possible'] > 0)
+            summary.drop(columns=['answered', 'partial', 'questions'], inplace=True)
+
+        # Assignments as columns, first appended first
+        order = df.groupby('assignment')['appended'].min().sort_values().index
+        totals = df.pivot(index='email', columns='assignment', values='total').reindex(columns=order)
+        totals.columns.name = None
+        totals.insert(0, 'Name', cadets['Name'])
+        totals.insert(1, 'Section', cadets['Section'])
+
+        return {
+            'Cadets': cadets.rename_axis('Email').reset_index(),
+            'Sections': sections.rename_axis('Section').reset_index(),
+            'Totals': totals.rename_axis('Email').reset_index(),
+        }
+
+    def export_summary(self, file_path) -> Path:
+        file_path = Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with pd.ExcelWriter(file_path) as writer:
+            for sheet_name, summary in self.summaries().items():
+                summary.to_excel(writer, sheet_name=sheet_name, index=False)
+
+        return file_path
@@ -1,57 +1,92 @@
+from __future__ import annotations
+
+import importlib
+import logging
 import sys
+import time
 from pathlib import Path
-from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+_started = time.perf_counter()
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QMessageBox, QLabel, QListWidget, QPushButton, QVBoxLayout, QHBoxLayout, QFileDialog, QTextEdit, QLineEdit, QGroupBox
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QMessageBox, QLabel, QListWidget, QPushButton, QVBoxLayout, QHBoxLayout, QFileDialog, QTableView, QLineEdit, QGroupBox, QCheckBox, QComboBox
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import QSize
-
-import openpyxl
-from openpyxl.styles import PatternFill, Alignment
-from openpyxl.styles.borders import Border, Side
-from openpyxl.utils.cell import get_column_letter
-
-import pandas as pd
-import pickle
-import csv
-import re
-
-
-@dataclass
-class Settings:
-    commentCode: str = None
-    documentationCode: str = None
-    courseNumber: str = None
-    roster: pd.DataFrame = None
-    header_length: int = 9
-    asst_name_idx: int = 4
-    asst_points_idx: int = 7
-    
-    output_directory: str = None
+from PyQt5.QtCore import Qt, QSize, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+_qt_imported = time.perf_counter()
+
+from config import Settings
+
+if TYPE_CHECKING:
+    from processing import Data, Processor
+    from profiling import Trace
+
+# Import time per module in seconds, reported with --startup-timing
+IMPORT_TIMES = {'PyQt5': _qt_imported - _started, 'config': time.perf_counter() - _qt_imported}
+# Imported on first load or export rather than at startup, in dependency order so each is timed on its own
+LAZY_MODULES = ('numpy', 'pandas', 'openpyxl', 'processing')
+REPORT_TIMING = False
+
+def report_timing(label, seconds):
+    if REPORT_TIMING:
+        print(f'{label:<20}{seconds * 1000:8.1f} ms', file=sys.stderr)
 
-    def save(self, filepath='settings/settings.pkl'):
-        with open(filepath, 'wb') as f:
-            pickle.dump(self, f)
+def timed_import(*names):
+    """Import the modules not imported yet, recording how long each took."""
+    for name in names:
+        if name not in sys.modules:
+            start = time.perf_counter()
+            importlib.import_module(name)
+            IMPORT_TIMES[name] = time.perf_counter() - start
+            report_timing(f'import {name}', IMPORT_TIMES[name])
 
-    @classmethod
-    def load(cls, filepath='settings/settings.pkl'):
+def import_processing():
+    timed_import(*LAZY_MODULES)
+    return sys.modules['processing']
+
+
+class JobCancelled(Exception):
+    pass
+
+class JobSignals(QObject):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+class Job(QRunnable):
+    """Runs a processing call on the thread pool, passing it a progress callback.
+
+    The callback emits the progress signal and raises JobCancelled once cancel() has been
+    requested, which unwinds the processing call at its next progress report.
+    """
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = JobSignals()
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+
+    def report(self, count):
+        if self._cancel_requested:
+            raise JobCancelled()
+        self.signals.progress.emit(count)
+
+    def run(self):
         try:
-            with open(filepath, 'rb') as f:
-                return pickle.load(f)
-        except FileNotFoundError:
-            return cls()
-
-@dataclass
-class Data:
-    raw_data: list = None
-    header_data: list = None
-    final_data: pd.DataFrame = None
-    name: str = None
-    points: list[float] = None
-    n_questions: int = None
-    qCodes: list[tuple[str, int]] = None
-    comment_idx: int = None
-    documentation_idx: int = None
+            result = self.fn(*self.args, progress=self.report, **self.kwargs)
+        except JobCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -72,7 +107,7 @@ class MainWindow(QMainWindow):
                 height: 100px;
                 font-family: Arial;
             }}
-            QListWidget, QTextEdit, QLineEdit {{
+            QListWidget, QTableView, QLineEdit {{
                 border: 1px solid grey;
             }}
             QGroupBox {{
@@ -91,8 +126,13 @@ class MainWindow(QMainWindow):
             output_dir.mkdir()
 
         # Global Variables
-        self.settings = Settings().load()
+        self.settings = Settings.load()
+        self._processor = None
         self.asst_data = None
+        # Trace of the loaded assignment's run, which its exports add to and write out
+        self.asst_trace = None
+        self.threadPool = QThreadPool()
+        self.jobs = {}
 
         # Initialize main widget
         main_widget = QWidget()
@@ -113,6 +153,23 @@ class MainWindow(QMainWindow):
         self.lnEdtDocumentationCode = QLineEdit(f'{self.settings.documentationCode if self.settings.documentationCode else ""}')
         lblCommentCode = QLabel("Comment Code")
         self.lnEdtCommentCode = QLineEdit(f'{self.settings.commentCode if self.settings.commentCode else ""}')
+        self.chkIncremental = QCheckBox("Only rewrite changed sections on export")
+        self.chkIncremental.setChecked(bool(self.settings.incremental_export))
+        self.chkWatch = QCheckBox("Watch a folder for new exports")
+        self.chkWatch.toggled.connect(self.toggle_watch)
+        self.watcher = None
+        self.watchTimer = QTimer(self)
+        self.watchTimer.timeout.connect(self.poll_watch)
+        lblMerge = QLabel("Merging several exports keeps")
+        self.cmbMerge = QComboBox()
+        for label, policy in (("Newest submission", 'newest'), ("Highest score", 'highest')):
+            self.cmbMerge.addItem(label, policy)
+        self.cmbMerge.setCurrentIndex(max(self.cmbMerge.findData(self.settings.merge_policy), 0))
+        lblProfile = QLabel("Profiling")
+        self.cmbProfile = QComboBox()
+        for label, mode in (("Off", None), ("Memory (tracemalloc)", 'tracemalloc'), ("Functions (cProfile)", 'cprofile')):
+            self.cmbProfile.addItem(label, mode)
+        self.cmbProfile.setCurrentIndex(max(self.cmbProfile.findData(self.settings.profile_mode), 0))
         self.btnSaveSettings = QPushButton("Save Settings", enabled=True, clicked=self.save_settings)
         
         optionLayout.addWidget(lblCourseNumber)
@@ -121,6 +178,12 @@ class MainWindow(QMainWindow):
         optionLayout.addWidget(self.lnEdtDocumentationCode)
         optionLayout.addWidget(lblCommentCode)
         optionLayout.addWidget(self.lnEdtCommentCode)
+        optionLayout.addWidget(self.chkIncremental)
+        optionLayout.addWidget(self.chkWatch)
+        optionLayout.addWidget(lblMerge)
+        optionLayout.addWidget(self.cmbMerge)
+        optionLayout.addWidget(lblProfile)
+        optionLayout.addWidget(self.cmbProfile)
         optionLayout.addStretch()
         optionLayout.addWidget(self.btnSaveSettings)
 
@@ -140,20 +203,30 @@ class MainWindow(QMainWindow):
         dataLayout = QVBoxLayout()
         grpData.setLayout(dataLayout)
 
-        self.txtData = QTextEdit()
-        self.txtData.setMinimumWidth(500)
-        self.txtData.setLineWrapMode(QTextEdit.NoWrap)
+        self.cmbSection = QComboBox(enabled=False)
+        self.cmbSection.addItem("All Sections")
+        self.cmbSection.currentIndexChanged.connect(self.filter_section)
+        self.tblData = QTableView()
+        self.tblData.setMinimumWidth(500)
+        self.tblData.setWordWrap(False)
+        self.tblData.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.tblData.setSortingEnabled(True)
         self.btnLoadData = QPushButton("Load Data", enabled=True, clicked=self.load_data_file)
         self.btnExportData = QPushButton("Export Data", enabled=False, clicked=self.export)
         self.btnLoadData.setIcon(QIcon('resources/icons/parse.ico'))
         self.btnLoadData.setIconSize(btnIconSize)
         self.btnExportData.setIcon(QIcon('resources/icons/export.png'))
         self.btnExportData.setIconSize(btnIconSize)
+        self.btnCancel = QPushButton("Cancel", enabled=False, clicked=self.cancel_jobs)
+        self.btnSummary = QPushButton("Export Summary", enabled=True, clicked=self.export_summary)
 
-        dataLayout.addWidget(self.txtData)
+        dataLayout.addWidget(self.cmbSection)
+        dataLayout.addWidget(self.tblData)
         tempHLayout = QHBoxLayout()
         tempHLayout.addWidget(self.btnLoadData)
         tempHLayout.addWidget(self.btnExportData)
+        tempHLayout.addWidget(self.btnSummary)
+        tempHLayout.addWidget(self.btnCancel)
         dataLayout.addLayout(tempHLayout)
 
         # Connect buttons to functions
@@ -167,7 +240,14 @@ class MainWindow(QMainWindow):
         # Set the layout for the GUI
         main_widget.setLayout(main_layout)
 
-        self.populate_roster()
+        # Listing the roster imports NumPy, so it is deferred until the window has been shown
+        QTimer.singleShot(0, self.populate_roster)
+
+    @property
+    def processor(self) -> Processor:
+        if self._processor is None:
+            self._processor = import_processing().Processor(self.settings)
+        return self._processor
 
     def show_message(self, message):
         msg = QMessageBox()
@@ -199,320 +279,261 @@ class MainWindow(QMainWindow):
             return file_name
 
     def populate_roster(self):
-        if self.settings.roster is None:
+        start = time.perf_counter()
+        # Until the roster is needed its names are read with NumPy alone, so startup does not import pandas
+        timed_import('numpy')
+        listing = self.settings.roster_listing()
+        if listing is None:
             self.show_message('You need to establish a class roster.')
             return
-        for name, section in zip(self.settings.roster['Cadet Name'], self.settings.roster['Section']):
-            self.listRoster.addItem(f'{name} ({section})')
+        self.listRoster.clear()
+        self.listRoster.addItems(listing)
         
         self.btnLoadData.setEnabled(True)
+        report_timing('roster listed', time.perf_counter() - start)
     
-    def populate_data_view(self, asst_data: Data):
-        self.txtData.setHtml(asst_data.final_data.to_html())
-        self.btnExportData.setEnabled(True)
-
-    def process_names(self, text):
-        match = re.search(r',[^ ]+', text)
-        text = text[:match.end()] if match else text
-
-        return text
+    def populate_data_view(self, asst_data: Data, trace: Trace):
+        # Only reached after a load, when the processing stack is already imported
+        from table_model import AssignmentTableModel
+
+        with self.processor.stage('populate_data_view', trace) as stage:
+            model = AssignmentTableModel(asst_data, self.tblData)
+            previous = self.tblData.model()
+            self.tblData.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+            self.tblData.setModel(model)
+            if previous is not None:
+                previous.deleteLater()
+            stage.rows = len(asst_data.final_data)
+
+        self.cmbSection.blockSignals(True)
+        self.cmbSection.clear()
+        self.cmbSection.addItem("All Sections")
+        self.cmbSection.addItems(model.section_names())
+        self.cmbSection.blockSignals(False)
+        self.cmbSection.setEnabled(True)
+
+        self.btnExportData.setEnabled('export' not in self.jobs)
+
+    def filter_section(self, index):
+        model = self.tblData.model()
+        if model is not None:
+            model.set_section(self.cmbSection.itemText(index) if index > 0 else None)
 
     def save_settings(self):
-        self.settings.courseNumber = self.lnEdtCourseNumber.text() if self.lnEdtCourseNumber.text() != '' else None
+        course_number = self.lnEdtCourseNumber.text() if self.lnEdtCourseNumber.text() != '' else None
+        # Switching course selects its students from the stored registrar instead of re-reading the file
+        if not self.settings.has_registrar:
+            self.settings.courseNumber = course_number
+        elif course_number is not None and course_number != self.settings.courseNumber:
+            # Selecting a course reads the stored registrar on the GUI thread
+            timed_import('numpy', 'pandas')
+            # select_course only changes courseNumber once the course is found
+            if self.settings.select_course(course_number):
+                self.populate_roster()
+            else:
+                self.report_missing_course(course_number)
+        # A cleared or unknown course keeps the loaded roster, so show the course it belongs to
+        self.lnEdtCourseNumber.setText(self.settings.courseNumber or '')
         self.settings.commentCode = self.lnEdtCommentCode.text() if self.lnEdtCommentCode.text() != '' else None
         self.settings.documentationCode = self.lnEdtDocumentationCode.text() if self.lnEdtDocumentationCode.text() != '' else None
+        self.settings.incremental_export = self.chkIncremental.isChecked()
+        self.settings.merge_policy = self.cmbMerge.currentData()
+        self.settings.profile_mode = self.cmbProfile.currentData()
         
         self.settings.save()
 
     def setup_roster(self):
+        # The course typed in the field applies without saving the settings first
+        course_number = self.lnEdtCourseNumber.text() or self.settings.courseNumber
+
         # Verify Data
-        if self.settings.courseNumber is None: 
+        if course_number is None: 
             self.show_message('You must enter course information before continuing')
             return
 
         # Verify intent
-        if self.settings.roster is not None and not self.confirm_action('This will reset the current roster, do you wish to continue?'): return
+        if self.settings.has_roster and not self.confirm_action('This will reset the current roster, do you wish to continue?'): return
 
         # Open file dialog
-        file_path = self.open_file_dialog("Excel Files (*.xlsx *.xls)")
+        file_path = self.open_file_dialog("Roster Files (*.xlsx *.xls *.csv)")
         if not file_path: 
             return
 
         try:
-            df = pd.read_excel(file_path, skiprows=1)
+            with self.processor.stage('setup_roster') as stage:
+                self.settings.set_registrar(self.processor.read_registrar(file_path))
+                found = self.settings.select_course(course_number)
+                self.settings.save()
+                stage.rows = len(self.settings.registrar)
 
-            df["Course Number"] = df["Course Number"].str.strip()
-            df = df[df["Course Number"] == f'{self.settings.courseNumber}'][["Section", "Email", "Cadet Name"]]
-            df["Cadet Name"] = df["Cadet Name"].str.strip().map(self.process_names)
+        except Exception as e:
+            self.show_error(f"Failed to load file\n{e}")
+            return
 
-            self.settings.roster = df
-            self.settings.save()
+        if found:
             self.populate_roster()
+        else:
+            # The typed course stays in the field, so correcting it and saving selects from the new registrar
+            self.report_missing_course(course_number)
 
-        except Exception as e:
-            self.show_error(f"Failed to load file\n{e}")
+    def report_missing_course(self, course_number, limit=20):
+        courses = self.settings.courses()
+        listed = ', '.join(courses[:limit]) + (', ...' if len(courses) > limit else '')
+        self.show_message(f'Course {course_number} is not in the loaded roster file. Courses found: {listed}')
     
     def load_data_file(self):
-        file_path = self.open_file_dialog("CSV Files (*.csv)")
-        if not file_path:
+        # Selecting several exports of one assignment merges them
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Open Files", "", "CSV Files (*.csv)")
+        if not file_paths:
             return
         
-        with open(file_path, 'r') as f:
-            data = f.readlines()
-            data = [x.strip() for x in data]
-            header = data[:self.settings.header_length]
-            body = data[self.settings.header_length:]
-        
-        asst_data = self.process_header(Data(raw_data=body, header_data=header))
-        asst_data = self.parse_data(asst_data)
-        
-        self.populate_data_view(asst_data)
+        self.start_job('load', self.btnLoadData, self.loaded, '{} rows parsed', self.load_file, file_paths, self.cmbMerge.currentData())
+
+    def load_file(self, file_paths, keep=None, progress=None):
+        # Runs on the worker thread, so the first load imports the processing stack off the GUI thread
+        processor = self.processor
+        from profiling import Trace
+
+        # Each load starts its own trace, so jobs running side by side never share one
+        trace = Trace()
+        with processor.stage('load_data_file', trace) as stage:
+            if len(file_paths) > 1:
+                asst_data = processor.merge_files(file_paths, keep, progress=progress, trace=trace)
+            else:
+                asst_data = processor.load_file(file_paths[0], progress=progress, trace=trace)
+            stage.rows = len(asst_data.final_data)
+
+        if self.settings.gradebook_directory:
+            from gradebook import Gradebook
+            with processor.stage('gradebook', trace):
+                Gradebook(self.settings.gradebook_directory).append(asst_data)
+
+        return asst_data, trace
+
+    def loaded(self, result: tuple[Data, Trace]):
+        asst_data, trace = result
+        self.populate_data_view(asst_data, trace)
         self.asst_data = asst_data
+        self.asst_trace = trace
+        name = asst_data.name.strip('"')
+        self.statusBar().showMessage(f'Loaded {name} ({len(asst_data.final_data)} students)')
 
-    def process_header(self, asst_data: Data):
-        header = asst_data.header_data
+        if asst_data.unmatched:
+            self.report_unmatched(asst_data.unmatched)
 
-        points = [float(x) for x in header[self.settings.asst_points_idx].split(',') if x != '' and x != 'Points']
-        name = header[self.settings.asst_name_idx].split(',')[1]
-        qCodes = [(x, j) for j, x in enumerate(header[6].split(',')) if x.isdecimal()]
+    def report_unmatched(self, unmatched, limit=20):
+        listed = '\n'.join(unmatched[:limit])
+        more = f'\n...and {len(unmatched) - limit} more' if len(unmatched) > limit else ''
+        self.show_message(f'{len(unmatched)} student(s) in the export were not found in the roster:\n{listed}{more}')
 
-        for code, j in qCodes:
-            if code == self.settings.commentCode:
-                asst_data.comment_idx = j
-            if code == self.settings.documentationCode:
-                asst_data.documentation_idx = j
+    def export(self):
+        # The checkbox applies straight away, without saving the settings first
+        self.start_job('export', self.btnExportData, self.exported, '{} sections written', self.export_data, self.asst_data, self.asst_trace, self.chkIncremental.isChecked())
 
-        asst_data.name = name
-        asst_data.points = points
-        asst_data.n_questions = len(points)
-        asst_data.qCodes = qCodes
+    def export_data(self, asst_data, trace, incremental, progress=None):
+        return self.processor.export(asst_data, progress=progress, incremental=incremental, trace=trace)
 
-        return asst_data
-    
-    def parse_data(self, data: Data):
-        csvReader = csv.reader(data.raw_data)
-        students: pd.DataFrame = self.settings.roster
-        result = []
-        email = ''
-        name = ''
-        comment = None
-        documentation = None
-
-        for i, row in enumerate(csvReader):
-            if i%2 == 1:
-                filter = students['Email'].isin([email])
-                if filter.any():
-                    section = students[filter]['Section'].iloc[0]
-                    nRow = [name, email, section]
-                    
-                    for j, entry in enumerate(row):
-                        if j == 3:
-                            nRow.append(float(entry))
-                        if j >= 4:
-                            if float(entry) == 0:
-                                nRow.append('-')
-                            elif float(entry) == data.points[j - 4]:
-                                nRow.append(1.0)
-                            else:
-                                nRow.append(0.5)
-                    
-                    if data.documentation_idx:
-                        nRow[-1] = documentation if documentation else ''
-                    if data.comment_idx:
-                        nRow[-2 if data.documentation_idx else -1] = comment if comment else ''
-
-                    result.append(nRow)          
-            else:
-                email = row[1].split('@usafa')[0]
-                name = self.process_names(row[0])
-                comment = row[data.comment_idx] if data.comment_idx else None
-                documentation = row[data.documentation_idx] if data.documentation_idx else None
+    def exported(self, file_path):
+        self.statusBar().showMessage(f'Exported to {file_path}')
 
-        header = ['Name','Email','Section', 'Total'] + [f'Q{x + 1}' for x in range(data.n_questions)]
+    def export_summary(self):
+        self.start_job('summary', self.btnSummary, self.exported, '', self.write_summary)
 
-        if data.documentation_idx:
-            header[-1] = 'Documentation'
-        if data.comment_idx:
-            header[-2 if data.documentation_idx else -1] = 'Comment'
+    def write_summary(self, progress=None):
+        # Imported here as the gradebook pulls in the processing stack
+        from gradebook import Gradebook
 
-        data.final_data = pd.DataFrame(result, columns=header)
+        return Gradebook(self.settings.gradebook_directory or 'gradebook').export_summary(Path('output') / 'summary.xlsx')
 
-        return data
+    def toggle_watch(self, checked):
+        if not checked:
+            self.watchTimer.stop()
+            self.watcher = None
+            return
 
-    def export(self):
-        asst_data = self.asst_data
-        output_dir = Path('output') / asst_data.name.strip('"')
-        file_path = output_dir / 'output.xlsx'
+        if not self.settings.has_roster:
+            self.show_message('You need to establish a class roster.')
+            self.chkWatch.setChecked(False)
+            return
 
-        if not output_dir.exists():
-            output_dir.mkdir()
-        
-        if file_path.exists():
-            output_wb = openpyxl.load_workbook(file_path)
-        else:
-            output_wb = openpyxl.Workbook()
-        
-        for section in asst_data.final_data['Section'].unique():
+        directory = QFileDialog.getExistingDirectory(self, "Watch Folder", self.settings.watch_directory or "")
+        if not directory:
+            self.chkWatch.setChecked(False)
+            return
 
-            if output_wb.sheetnames[0] == 'Sheet':
-                ws = output_wb.active
-                ws.title = f'{section}'
-            elif section in output_wb.sheetnames:
-                ws = output_wb[section]
-            else:
-                ws = output_wb.create_sheet(title=section)
+        from watch import WATCH_STATE, FolderWatcher
 
-            self.generate_excel_table(asst_data.final_data[asst_data.final_data['Section'] == section], ws)
-        
-        output_wb.save(file_path)
-
-    def _pixel_to_pt(self, x):
-        return x / 7.0
-
-    def _truncate_string(self, s, max_length=20):
-        return s if len(s) <= max_length else s[:max_length] + '...'
-
-    def _truncate_or_pad_string(self, s, max_length=70):
-        return (s[:max_length - 3] + '...') if len(s) > max_length else s.ljust(max_length)
-
-    def generate_excel_table(self, df: pd.DataFrame, ws):
-        # define fill colors
-        greenFill = PatternFill(start_color='FF00B050', end_color='FF00B050', fill_type='solid')
-        redFill = PatternFill(start_color='FFC00000', end_color='FFC00000', fill_type='solid')
-        borderFill = PatternFill(start_color='FF808080', end_color='FF808080', fill_type='solid')
-        headerFill = PatternFill(start_color='FFD9D9D9', end_color='FFD9D9D9', fill_type='solid')
-        whiteFill = PatternFill(start_color='FFFFFFFF', end_color='FFFFFFFF', fill_type='solid')
-        warningFill = PatternFill(start_color='FFF59412', end_color='FFF59412', fill_type='solid')
-
-        # Define border styles
-        thin_all_sides = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-        thin_bottom = Border(bottom=Side(style='thin'))
-        thin_bottom_sides = Border(left=Side(style='thin'), right=Side(style='thin'), bottom=Side(style='thin'))
-        thin_sides = Border(left=Side(style='thin'), right=Side(style='thin'))
-
-        df = df.drop(['Email', 'Section'], axis=1, inplace=False).reset_index(drop=True)
-        question_cols = [col for col in df.columns if col.startswith('Q')]
-        n_questions = len(question_cols)
-        n_students = len(df)
-        documentation = 'Documentation' in df.columns
-        comment = 'Comment' in df.columns
-        last_col = 0
-        pasteLoc = None
-
-        center_align = Alignment(horizontal='center', vertical='center')
-        left_align_indent = Alignment(horizontal='left', vertical='center', indent=1)
-
-        # Set column widths
-        ws.column_dimensions['A'].width = self._pixel_to_pt(22)
-        ws.column_dimensions['B'].width = self._pixel_to_pt(200)
-        ws.column_dimensions['C'].width = self._pixel_to_pt(48)
-
-        for i in range(n_questions):
-            last_col = 4 + i
-            col = get_column_letter(last_col)
-            ws.column_dimensions[col].width = self._pixel_to_pt(30)
-        
-        if comment:
-            last_col += 1
-            col = get_column_letter(last_col)
-            ws.column_dimensions[col].width = self._pixel_to_pt(665)
-            pasteLoc = (col, len(df['Name']) + 8)
-
-        if documentation:
-            last_col += 1
-            col = get_column_letter(last_col)
-            ws.column_dimensions[col].width = self._pixel_to_pt(294)
-        
-        ws.column_dimensions[get_column_letter(last_col + 1)].width = self._pixel_to_pt(21)
-
-        # Set row heights
-        for i in range(1, n_students + 21):
-            ws.row_dimensions[i].height = 20
-
-        for col in range(1, len(df.columns) + 3):
-            for row in range(1, len(df['Name']) + 6):
-                ws[f'{get_column_letter(col)}{row}'].fill = borderFill
-
-        # Write Title
-        ws['B2'] = self.asst_data.name.strip('"')
-        ws['B2'].fill = headerFill
-        ws['B2'].border = thin_all_sides
-        ws.merge_cells(f'B2:{get_column_letter(last_col)}2')
-        ws['B2'].alignment = center_align
-
-        # Write Headers
-        for i, title in enumerate(df.columns):
-            cell = f'{get_column_letter(2 + i)}4'
-            title = title if title != 'Comment' else 'What did you find interesting/useful/confusing?'
-            title = title if title != 'Documentation' else 'Documentation Statement'
-            ws[cell] = title
-            ws[cell].alignment = center_align if title.startswith(('Q', 'T')) else left_align_indent
-            ws[cell].fill = headerFill
-            ws[cell].border = thin_all_sides
-
-        # Write Student Data
-        for idx, student in df.iterrows():
-            col = 2
-            row = idx + 5
-
-            ws[f'{get_column_letter(col)}{row}'] = f'{student["Name"]}'
-            ws[f'{get_column_letter(col)}{row}'].alignment = left_align_indent
-            ws[f'{get_column_letter(col)}{row}'].fill = whiteFill
-            ws[f'{get_column_letter(col)}{row}'].border = thin_all_sides
-
-            col += 1
-            ws[f'{get_column_letter(col)}{row}'] = f'{student["Total"]}'
-            ws[f'{get_column_letter(col)}{row}'].alignment = center_align
-            ws[f'{get_column_letter(col)}{row}'].fill = whiteFill
-            ws[f'{get_column_letter(col)}{row}'].border = thin_all_sides
-
-            for i in range(n_questions):
-                col = 4 + i
-                cell = f'{get_column_letter(col)}{row}'
-                val = student[f'Q{i + 1}']
-                ws[cell] = val if val == '-' else ''
-                ws[cell].alignment = center_align
-                ws[cell].border = thin_all_sides
-                if val == 1:
-                    ws[cell].fill = greenFill
-                elif val == 0.5:
-                    ws[cell].fill = redFill
-                elif val == '-':
-                    ws[cell].fill = whiteFill
-                else:
-                    ws[cell].fill = warningFill
-            
-            if comment:
-                col += 1
-                ws[f'{get_column_letter(col)}{row}'] = self._truncate_or_pad_string(f'{student["Comment"]}', max_length=95)
-                ws[f'{get_column_letter(col)}{row}'].alignment = left_align_indent
-                ws[f'{get_column_letter(col)}{row}'].fill = whiteFill
-                ws[f'{get_column_letter(col)}{row}'].border = thin_all_sides
-
-            if documentation:
-                col += 1
-                ws[f'{get_column_letter(col)}{row}'] = self._truncate_or_pad_string(f'{student["Documentation"]}', max_length=40)
-                ws[f'{get_column_letter(col)}{row}'].alignment = left_align_indent
-                ws[f'{get_column_letter(col)}{row}'].fill = whiteFill
-                ws[f'{get_column_letter(col)}{row}'].border = thin_all_sides
-
-        if pasteLoc:
-            filter_list = ['', ' ', '.', 'none', 'n/a', 'nope', 'negative', 'nothing yet', 'nothing', 'nothing.', 'nothing so far', 'none so far', 'none for now']
-            allowed_comments = df[~df['Comment'].str.lower().isin(filter_list)]['Comment'].reset_index(drop=True)
-
-            col, row = pasteLoc
-
-            ws[f'{col}{row}'] = 'Copy and Paste Comments:'
-            ws[f'{col}{row}'].border = thin_bottom
-
-            for idx, student_comment in enumerate(allowed_comments.to_list()):
-                ws[f'{col}{row + idx + 1}'] = student_comment
-                ws[f'{col}{row + idx + 1}'].border = thin_sides if idx != len(allowed_comments) - 1 else thin_bottom_sides
-
-        print(f'{question_cols=}, {documentation=}, {comment=}')
+        self.settings.watch_directory = directory
+        self.settings.save()
+        self.watcher = FolderWatcher(directory, Path('output') / WATCH_STATE, self.settings.watch_settle)
+        self.watchTimer.start(int(self.settings.watch_interval * 1000))
+        self.statusBar().showMessage(f'Watching {directory}')
+
+    def poll_watch(self):
+        if self.watcher is None or 'watch' in self.jobs:
+            return
+
+        watcher = self.watcher
+        ready = watcher.settled()
+        if ready:
+            self.start_job('watch', self.chkWatch, self.watched, f'Watch: {{}} of {len(ready)} exports checked', self.process_watched, watcher, ready,
+                           self.chkIncremental.isChecked())
+            # Files a cancelled batch never reached are offered again on the next poll
+            self.jobs['watch'].signals.cancelled.connect(lambda: watcher.release(ready))
+
+    def process_watched(self, watcher, paths, incremental, progress=None):
+        from gradebook import Gradebook
+        from watch import process_ready
+
+        gradebook = Gradebook(self.settings.gradebook_directory) if self.settings.gradebook_directory else None
+        return process_ready(self.processor, watcher, paths, 'output', gradebook, progress=progress, incremental=incremental)
+
+    def watched(self, results):
+        if results:
+            self.statusBar().showMessage(f'Watch: updated {", ".join(str(output_path) for _, output_path in results)}')
+
+    def start_job(self, key, button, on_finished, progress_text, fn, *args):
+        job = Job(fn, *args)
+        job.signals.progress.connect(lambda count: self.statusBar().showMessage(progress_text.format(count)))
+        job.signals.finished.connect(on_finished)
+        job.signals.failed.connect(lambda message: self.show_error(f"{key.capitalize()} failed\n{message}"))
+        job.signals.cancelled.connect(lambda: self.statusBar().showMessage(f'{key.capitalize()} cancelled'))
+        # Connected last so the button is re-enabled only after the result has been handled
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(lambda *_: self.finish_job(key, button))
+
+        self.jobs[key] = job
+        button.setEnabled(False)
+        self.btnCancel.setEnabled(True)
+        self.threadPool.start(job)
+
+    def finish_job(self, key, button):
+        self.jobs.pop(key, None)
+        button.setEnabled(key != 'export' or self.asst_data is not None)
+        self.btnCancel.setEnabled(bool(self.jobs))
+
+    def cancel_jobs(self):
+        for job in self.jobs.values():
+            job.cancel()
+
+    def closeEvent(self, event):
+        self.cancel_jobs()
+        if self._processor is not None:
+            self._processor.close()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+    if '--startup-timing' in sys.argv:
+        sys.argv.remove('--startup-timing')
+        REPORT_TIMING = True
+
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+
+    for name, seconds in IMPORT_TIMES.items():
+        report_timing(f'import {name}', seconds)
+    report_timing('window.show()', time.perf_counter() - _started)
+
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,829 @@
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, TextIO
+
+import openpyxl
+from openpyxl.styles import PatternFill, Alignment
+from openpyxl.styles.borders import Border, Side
+from openpyxl.utils.cell import get_column_letter
+
+import numpy as np
+import pandas as pd
+
+try:
+    import python_calamine
+except ImportError:
+    python_calamine = None
+
+from cache import AssignmentCache, file_digest
+from comments import CommentFilter, CommentTriage
+from config import ROSTER_COLUMNS, RosterIndex, Settings
+from profiling import Trace
+from sheets import LAYOUT_VERSION, SheetLayout, assemble_workbook, build_layout, patch_sheet, render_section, replace_sheet, save_layouts
+
+
+@dataclass
+class Data:
+    raw_data: Iterator[tuple[list[str], list[str]]] = None
+    header_data: list = None
+    final_data: pd.DataFrame = None
+    name: str = None
+    points: list[float] = None
+    n_questions: int = None
+    qCodes: list[tuple[str, int]] = None
+    comment_idx: int = None
+    documentation_idx: int = None
+    unmatched: list[str] = None
+    scores: np.ndarray = None
+    outcomes: np.ndarray = None
+    totals: np.ndarray = None
+    comments: np.ndarray = None
+    documentations: np.ndarray = None
+    section_rows: dict[str, slice] = None
+
+def read_header(f: TextIO, header_length: int) -> list[str]:
+    """Read the fixed-size export header, leaving the handle positioned at the first student."""
+    return [f.readline().strip() for _ in range(header_length)]
+
+def iter_student_rows(f: TextIO) -> Iterator[tuple[list[str], list[str]]]:
+    """Yield (identity row, score row) pairs straight from the file handle.
+
+    The handle must be opened with newline='' so quoted comments spanning several
+    lines are kept in a single field.
+    """
+    reader = (row for row in csv.reader(f) if row)
+
+    for identity in reader:
+        score = next(reader, None)
+        if score is None:
+            return
+        yield identity, score
+
+# calamine reads registrar workbooks several times faster than openpyxl, when it is installed
+ROSTER_EXCEL_ENGINE = 'calamine' if python_calamine else None
+
+REGISTRAR_COLUMNS = ['Course Number', *ROSTER_COLUMNS]
+
+def clean_names(names: pd.Series) -> pd.Series:
+    """Cut each "Last,First Middle" name after the first word following its comma."""
+    return names.str.replace(r'^(.*?,[^ ]+).*$', r'\1', regex=True, flags=re.DOTALL)
+
+# 'fast' streams precomputed layouts into a fresh workbook, 'legacy' edits the existing one cell by cell
+EXPORT_ENGINES = ('fast', 'legacy')
+
+def graded_questions(data: Data) -> int:
+    # Comment and documentation questions are the trailing columns and are not scored
+    return data.n_questions - bool(data.comment_idx) - bool(data.documentation_idx)
+
+def build_final_data(data: Data, names, emails, sections, comments, documentations):
+    """Set final_data, the free-text columns and section_rows on data from the identity columns and scored matrices.
+
+    final_data holds a categorical Section, the totals and one int8 outcome code per question;
+    comments and documentation are kept apart as arrays. Rows are grouped by section, in the
+    order sections first appear and keeping the export's order within each, so every section
+    is one contiguous slice of all of these.
+    """
+    sections = pd.Categorical(sections, categories=pd.unique(pd.Series(sections, dtype=object).dropna()))
+    order = np.argsort(sections.codes, kind='stable')
+    sections = sections[order]
+
+    def take(values):
+        return np.asarray(values, dtype=object)[order]
+
+    data.scores, data.outcomes, data.totals = data.scores[order], data.outcomes[order], data.totals[order]
+    data.comments = take(comments) if data.comment_idx else None
+    data.documentations = take(documentations) if data.documentation_idx else None
+
+    columns = {'Name': take(names), 'Email': take(emails), 'Section': sections, 'Total': data.totals}
+    columns.update({f'Q{x + 1}': data.outcomes[:, x] for x in range(graded_questions(data))})
+    data.final_data = pd.DataFrame(columns)
+
+    # Students without a section sort first and belong to no section
+    counts = np.bincount(sections.codes[sections.codes >= 0], minlength=len(sections.categories))
+    ends = np.cumsum(counts) + np.count_nonzero(sections.codes < 0)
+    data.section_rows = {f'{section}': slice(end - count, end) for section, count, end in zip(sections.categories, counts, ends)}
+
+def section_table(data: Data, section: str) -> pd.DataFrame:
+    """One section as the exporters draw it: '-', 1.0, 0.5 or the raw score per question, then the free text."""
+    rows = data.section_rows[section]
+    final_data = data.final_data.iloc[rows]
+    cells = outcome_view(data.outcomes[rows], data.scores[rows])
+
+    columns = {'Name': final_data['Name'].to_numpy(), 'Email': final_data['Email'].to_numpy(),
+               'Section': final_data['Section'].to_numpy(), 'Total': data.totals[rows]}
+    columns.update({f'Q{x + 1}': cells[:, x] for x in range(cells.shape[1])})
+    if data.comments is not None:
+        columns['Comment'] = data.comments[rows]
+    if data.documentations is not None:
+        columns['Documentation'] = data.documentations[rows]
+
+    return pd.DataFrame(columns)
+
+# Which snapshot's row a cadet keeps when several exports of one assignment are merged
+MERGE_POLICIES = ('newest', 'highest')
+
+def merge_snapshots(snapshots: list[Data], keep: str = 'newest') -> Data:
+    """Merge parsed exports of the same assignment, given oldest first, into one row per cadet.
+
+    Rows are matched on email. 'newest' keeps each cadet's row from the latest snapshot they
+    appear in, 'highest' the row with the highest total, the newest one on ties. Cadets are
+    listed in the newest snapshot's order, followed by those only found in older ones.
+    """
+    if keep not in MERGE_POLICIES:
+        raise ValueError(f'Unknown merge policy {keep!r}, expected one of {MERGE_POLICIES}')
+
+    newest = snapshots[-1]
+    for data in snapshots[:-1]:
+        if (data.name, data.points, data.qCodes) != (newest.name, newest.points, newest.qCodes):
+            raise ValueError(f'Cannot merge {data.name} with {newest.name}: the assignments or their questions differ')
+
+    # Newest snapshot first, so factorizing the emails numbers cadets in the order they are listed
+    newest_first = snapshots[::-1]
+    emails = np.concatenate([data.final_data['Email'].to_numpy(dtype=object) for data in newest_first])
+    cadets, _ = pd.factorize(emails)
+    age = np.repeat(np.arange(len(newest_first)), [len(data.final_data) for data in newest_first])
+    rows = pd.DataFrame({'cadet': cadets, 'age': age, 'total': np.concatenate([data.totals for data in newest_first])})
+
+    # Rows are already newest first within each cadet, so only the highest policy needs a sort
+    if keep == 'highest':
+        rows = rows.sort_values(['total', 'age'], ascending=[False, True], kind='stable')
+    chosen = rows.drop_duplicates('cadet').sort_values('cadet').index.to_numpy()
+
+    def take(values):
+        return np.concatenate([values(data) for data in newest_first])[chosen]
+
+    merged = Data(header_data=newest.header_data, name=newest.name, points=newest.points, n_questions=newest.n_questions,
+                  qCodes=newest.qCodes, comment_idx=newest.comment_idx, documentation_idx=newest.documentation_idx)
+    merged.scores, merged.outcomes, merged.totals = take(lambda d: d.scores), take(lambda d: d.outcomes), take(lambda d: d.totals)
+    merged.unmatched = list(dict.fromkeys(email for data in newest_first for email in data.unmatched))
+
+    build_final_data(merged, take(lambda d: d.final_data['Name'].to_numpy(dtype=object)), emails[chosen],
+                     take(lambda d: d.final_data['Section'].to_numpy(dtype=object)),
+                     take(lambda d: d.comments) if merged.comment_idx else None,
+                     take(lambda d: d.documentations) if merged.documentation_idx else None)
+
+    return merged
+
+def section_digest(section_data: pd.DataFrame, title: str, paste: list[str] = ()) -> str:
+    """Content digest of one section's slice of final_data and its pasted comments as they would be rendered."""
+    digest = hashlib.sha256(f'{LAYOUT_VERSION}\x1f{title}\x1f'.encode())
+    digest.update('\x1f'.join(section_data.columns).encode())
+    digest.update(pd.util.hash_pandas_object(section_data, index=False).to_numpy().tobytes())
+    digest.update('\x1e'.join(paste).encode())
+
+    return digest.hexdigest()
+
+def row_digests(section_data: pd.DataFrame, title: str, paste: list[str] = ()) -> dict:
+    """Digests of one section's rows, for redrawing only the rows that changed.
+
+    'frame' covers what fixes where each row is drawn (the title, columns and the cadets in
+    order), 'rows' has one digest per student row and 'comments' covers the pasted comments.
+    """
+    frame = hashlib.sha256(f'{LAYOUT_VERSION}\x1f{title}\x1f'.encode())
+    frame.update('\x1f'.join(section_data.columns).encode())
+    frame.update(pd.util.hash_pandas_object(section_data['Email'], index=False).to_numpy().tobytes())
+
+    comments = hashlib.sha256('\x1e'.join(paste).encode())
+
+    rows = pd.util.hash_pandas_object(section_data, index=False).to_numpy()
+
+    return {'frame': frame.hexdigest(), 'rows': [f'{x:016x}' for x in rows], 'comments': comments.hexdigest()}
+
+def changed_rows(recorded: dict, digests: dict) -> list[int]:
+    """Positions of the rows that differ between two row_digests, or None if the sheet must be redrawn whole."""
+    if not recorded or recorded.get('frame') != digests['frame']:
+        return None
+
+    return [i for i, (before, after) in enumerate(zip(recorded['rows'], digests['rows'])) if before != after]
+
+def load_digests(digests_path: Path, file_path: Path) -> dict[str, dict]:
+    """Section and row digests recorded for a workbook, or {} if the workbook changed since they were written."""
+    try:
+        with open(digests_path, 'r') as f:
+            recorded = json.load(f)
+        stat = file_path.stat()
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    if recorded.get('workbook') != {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}:
+        return {}
+
+    return {'sections': recorded.get('sections', {}), 'rows': recorded.get('rows', {})}
+
+def save_digests(digests_path: Path, file_path: Path, digests: dict[str, str], rows: dict[str, dict]):
+    stat = file_path.stat()
+    with open(digests_path, 'w') as f:
+        json.dump({'workbook': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}, 'sections': digests, 'rows': rows}, f, indent=2)
+
+# Bump whenever parsing changes, so cached assignments from older versions are not reused
+PARSE_VERSION = 1
+
+# Number of student rows between progress callbacks while parsing
+PROGRESS_INTERVAL = 100
+
+# Outcome codes for a single question cell
+OUTCOME_MISSING = 0
+OUTCOME_FULL = 1
+OUTCOME_PARTIAL = 2
+OUTCOME_ANOMALOUS = 3
+
+# Cell values the exporters draw for each outcome code
+OUTCOME_VALUES = np.array(['-', 1.0, 0.5, None], dtype=object)
+
+def parse_score_matrix(rows: list[list[str]], width: int) -> np.ndarray:
+    """Parse ragged rows of score strings into a (rows x width) float matrix, NaN where unparseable."""
+    if not rows:
+        return np.empty((0, width), dtype=float)
+
+    rows = [row[:width] + [''] * (width - len(row)) if len(row) != width else row for row in rows]
+
+    try:
+        return np.array(rows, dtype=float)
+    except ValueError:
+        flat = pd.to_numeric(pd.Series(np.array(rows, dtype=object).ravel()), errors='coerce')
+        return flat.to_numpy(dtype=float).reshape(len(rows), width)
+
+def score_outcomes(scores: np.ndarray, points) -> np.ndarray:
+    """Classify each cell of a (students x questions) score matrix against the points vector.
+
+    A score of 0 is missing, a score equal to the question's points is full credit, anything
+    in between is partial credit. Unparseable, negative or over-maximum scores are anomalous.
+    """
+    points = np.asarray(points, dtype=float)
+
+    outcomes = np.full(scores.shape, OUTCOME_PARTIAL, dtype=np.int8)
+    outcomes[scores == points] = OUTCOME_FULL
+    outcomes[scores == 0] = OUTCOME_MISSING
+    outcomes[np.isnan(scores) | (scores < 0) | (scores > points)] = OUTCOME_ANOMALOUS
+
+    return outcomes
+
+def outcome_view(outcomes: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """Map outcome codes back to the '-'/1.0/0.5 cell values, keeping the raw score for anomalies."""
+    cells = OUTCOME_VALUES[outcomes]
+    anomalous = outcomes == OUTCOME_ANOMALOUS
+    cells[anomalous] = scores[anomalous]
+
+    return cells
+
+class Processor:
+    """Parses Cengage exports and writes the section workbooks, independent of the GUI."""
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.cache = AssignmentCache(settings.cache_directory, settings.cache_max_mb * 2**20) if settings.cache_directory else None
+        self.comment_filter = CommentFilter(settings.comment_filler_patterns, settings.comment_normalize_pattern)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def pool(self) -> ProcessPoolExecutor:
+        """Section workers, started on first use and kept until close() so later exports skip spawning them."""
+        with self._pool_lock:
+            # A worker that died while idle leaves the pool broken, so replace it rather than fail the export
+            if self._pool is None or self._pool._broken:
+                # Spawned rather than forked: the GUI exports from a worker thread, and forking a threaded process can deadlock
+                self._pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def close(self):
+        """Shut down the section workers, if any were started."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def stage(self, name: str, trace: Trace = None):
+        """Record the enclosed block as a stage of the run traced by trace, profiled according to settings.profile_mode.
+
+        Without a trace the stage is only logged.
+        """
+        return (Trace() if trace is None else trace).stage(name, self.settings.profile_mode)
+
+    def triage_comments(self, data: Data, trace: Trace = None) -> CommentTriage:
+        """Triage the comments of a whole assignment once; sections then slice the result."""
+        with self.stage('comment_triage', trace) as stage:
+            stage.rows = len(data.final_data)
+            return self.comment_filter.triage(data.comments, data.documentations, data.final_data['Section'].cat.codes.to_numpy())
+
+    def read_registrar(self, file_path) -> pd.DataFrame:
+        """Read every course of a registrar roster, from Excel or CSV, with names already cleaned.
+
+        The Excel export has a title row above the column headers; a CSV may or may not.
+        """
+        file_path = Path(file_path)
+        if file_path.suffix.lower() == '.csv':
+            with open(file_path, 'r', newline='') as f:
+                titled = 'Course Number' not in f.readline()
+            df = pd.read_csv(file_path, skiprows=int(titled), usecols=REGISTRAR_COLUMNS, dtype=str)
+        else:
+            df = pd.read_excel(file_path, skiprows=1, usecols=REGISTRAR_COLUMNS, engine=ROSTER_EXCEL_ENGINE)
+
+        df["Course Number"] = df["Course Number"].str.strip()
+        df["Cadet Name"] = clean_names(df["Cadet Name"].str.strip())
+
+        return df
+
+    def load_roster(self, file_path) -> pd.DataFrame:
+        df = self.read_registrar(file_path)
+
+        return df[df["Course Number"] == f'{self.settings.courseNumber}'][ROSTER_COLUMNS]
+
+    def read_header(self, file_path) -> Data:
+        with open(file_path, 'r', newline='') as f:
+            header = read_header(f, self.settings.header_length)
+
+        return self.process_header(Data(header_data=header))
+
+    def load_file(self, file_path, progress: Callable[[int], None] = None, trace: Trace = None) -> Data:
+        key = self.cache_key(file_path) if self.cache else None
+        if key:
+            with self.stage('load_cache', trace) as stage:
+                cached = self.cache.get(key)
+                asst_data = self._from_cache(*cached) if cached else None
+                stage.rows = len(asst_data.final_data) if asst_data else 0
+            if asst_data:
+                if progress:
+                    progress(len(asst_data.final_data) + len(asst_data.unmatched))
+                return asst_data
+
+        with open(file_path, 'r', newline='') as f:
+            with self.stage('process_header', trace):
+                header = read_header(f, self.settings.header_length)
+                asst_data = self.process_header(Data(raw_data=iter_student_rows(f), header_data=header))
+            with self.stage('parse_data', trace) as stage:
+                asst_data = self.parse_data(asst_data, progress)
+                stage.rows = len(asst_data.final_data) + len(asst_data.unmatched)
+
+        if key:
+            self.cache.put(key, *self._to_cache(asst_data))
+
+        return asst_data
+
+    def merge_files(self, file_paths, keep: str = None, progress: Callable[[int], None] = None, trace: Trace = None) -> Data:
+        """Load several exports of one assignment and merge them into one row per cadet.
+
+        The exports are taken oldest first by modification time, and keep defaults to
+        settings.merge_policy (see merge_snapshots).
+        """
+        keep = keep or self.settings.merge_policy
+        file_paths = sorted(map(Path, file_paths), key=lambda path: path.stat().st_mtime_ns)
+        snapshots = []
+        loaded = 0
+
+        for file_path in file_paths:
+            snapshots.append(self.load_file(file_path, (lambda count: progress(loaded + count)) if progress else None, trace))
+            loaded += len(snapshots[-1].final_data) + len(snapshots[-1].unmatched)
+
+        with self.stage('merge', trace) as stage:
+            asst_data = merge_snapshots(snapshots, keep)
+            stage.rows = loaded
+
+        return asst_data
+
+    def cache_key(self, file_path) -> str:
+        """Key a parsed export on its content, the roster and every setting that affects parsing."""
+        settings = self.settings
+        roster = settings.roster_index
+        parts = [
+            PARSE_VERSION, file_digest(file_path), roster.fingerprint if roster else None,
+            settings.commentCode, settings.documentationCode,
+            settings.header_length, settings.asst_name_idx, settings.asst_points_idx,
+        ]
+
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def _to_cache(self, data: Data) -> tuple[dict, dict[str, np.ndarray]]:
+        meta = {
+            'header_data': data.header_data, 'name': data.name, 'points': data.points, 'n_questions': data.n_questions,
+            'qCodes': data.qCodes, 'comment_idx': data.comment_idx, 'documentation_idx': data.documentation_idx,
+            'unmatched': data.unmatched,
+        }
+        arrays = {'scores': data.scores, 'outcomes': data.outcomes, 'totals': data.totals}
+        columns = {'Name': data.final_data['Name'], 'Email': data.final_data['Email'], 'Section': data.final_data['Section'],
+                   'Comment': data.comments, 'Documentation': data.documentations}
+        for column, values in columns.items():
+            if values is not None:
+                values = np.asarray(values)
+                # Text stays a fixed-width unicode array so the cache never needs pickle
+                arrays[column] = values.astype(str) if values.dtype == object else values
+
+        return meta, arrays
+
+    def _from_cache(self, meta: dict, arrays: dict[str, np.ndarray]) -> Data:
+        data = Data(**meta)
+        data.qCodes = [tuple(x) for x in data.qCodes]
+        data.scores, data.outcomes, data.totals = arrays['scores'], arrays['outcomes'], arrays['totals']
+
+        def column(name):
+            if name not in arrays:
+                return None
+            return arrays[name].astype(object) if arrays[name].dtype.kind == 'U' else arrays[name]
+
+        build_final_data(data, column('Name'), column('Email'), column('Section'), column('Comment'), column('Documentation'))
+
+        return data
+
+    def process_header(self, asst_data: Data):
+        header = asst_data.header_data
+
+        points = [float(x) for x in header[self.settings.asst_points_idx].split(',') if x != '' and x != 'Points']
+        name = header[self.settings.asst_name_idx].split(',')[1]
+        qCodes = [(x, j) for j, x in enumerate(header[6].split(',')) if x.isdecimal()]
+
+        for code, j in qCodes:
+            if code == self.settings.commentCode:
+                asst_data.comment_idx = j
+            if code == self.settings.documentationCode:
+                asst_data.documentation_idx = j
+
+        asst_data.name = name
+        asst_data.points = points
+        asst_data.n_questions = len(points)
+        asst_data.qCodes = qCodes
+
+        return asst_data
+    
+    def parse_data(self, data: Data, progress: Callable[[int], None] = None):
+        """Build final_data from the export rows.
+
+        progress, if given, is called with the number of rows parsed so far and may raise to abort.
+        """
+        students: RosterIndex = self.settings.roster_index
+        # Only the total and the graded questions are parsed, so the free-text columns can't force the slow path
+        n_graded = graded_questions(data)
+        identities = []
+        score_rows = []
+        unmatched = []
+
+        for i, (identity, row) in enumerate(data.raw_data, start=1):
+            if progress and i % PROGRESS_INTERVAL == 0:
+                progress(i)
+
+            email = identity[1].split('@usafa')[0]
+            student = students.lookup(email)
+            if student is None:
+                unmatched.append(email)
+                continue
+
+            section, _ = student
+            name = identity[0]
+            comment = identity[data.comment_idx] if data.comment_idx else ''
+            documentation = identity[data.documentation_idx] if data.documentation_idx else ''
+
+            identities.append((name, email, section, comment, documentation))
+            score_rows.append(row[3:4 + n_graded])
+
+        if progress:
+            progress(len(identities) + len(unmatched))
+
+        matrix = parse_score_matrix(score_rows, n_graded + 1)
+        data.totals = matrix[:, 0]
+        data.scores = matrix[:, 1:]
+        data.outcomes = score_outcomes(data.scores, data.points[:n_graded])
+        data.unmatched = unmatched
+
+        names, emails, sections, comments, documentations = zip(*identities) if identities else ((),) * 5
+        names = clean_names(pd.Series(names, dtype=object)).to_numpy()
+        build_final_data(data, names, emails, sections, comments, documentations)
+
+        return data
+
+    def export(self, asst_data: Data, output_root='output', progress: Callable[[int], None] = None, engine: str = None,
+               incremental: bool = None, parallel: bool = None, per_section: bool = None, trace: Trace = None) -> Path:
+        """Write one sheet per section into output_root/<assignment>/output.xlsx.
+
+        The export's stages are added to trace, normally the one the assignment was loaded with
+        (a new one if not given), and the whole trace is written beside the workbook.
+
+        progress, if given, is called with the number of sections written so far and may raise
+        to abort before the workbook is saved. The remaining options default to the matching
+        Settings fields and only apply to the fast engine:
+
+        - incremental redraws just the sections whose content changed, and only the changed
+          rows of a section whose cadets are the same as last time
+        - parallel renders each section in its own worker process; workers are spawned, so a
+          script calling it needs an `if __name__ == '__main__'` guard
+        - per_section writes output_root/<assignment>/<section>.xlsx instead of one workbook,
+          rendering in parallel; the assignment directory is returned
+
+        An existing workbook is updated in place, so sheets of sections missing from asst_data
+        (and any added by hand) are kept. Without incremental every section's sheet is redrawn.
+        """
+        engine = engine or self.settings.export_engine
+        incremental = self.settings.incremental_export if incremental is None else incremental
+        parallel = self.settings.parallel_export if parallel is None else parallel
+        per_section = self.settings.workbook_per_section if per_section is None else per_section
+        trace = Trace() if trace is None else trace
+        if engine not in EXPORT_ENGINES:
+            raise ValueError(f'Unknown export engine {engine!r}, expected one of {EXPORT_ENGINES}')
+        # A workbook without sheets cannot be opened, and there would be nothing to put in one
+        if not asst_data.section_rows:
+            raise ValueError(f'Nothing to export for {asst_data.name}: none of its {len(asst_data.unmatched)} students are on the roster')
+
+        output_dir = Path(output_root) / asst_data.name.strip('"')
+        file_path = output_dir / 'output.xlsx'
+
+        if not output_dir.exists():
+            output_dir.mkdir(parents=True)
+
+        with self.stage('export', trace) as stage:
+            stage.rows = len(asst_data.final_data)
+            triage = self.triage_comments(asst_data, trace)
+            if engine == 'legacy':
+                self._export_legacy(asst_data, triage, file_path, progress)
+            elif per_section:
+                self._export_parallel(asst_data, triage, output_dir, progress, per_section=True)
+            elif incremental:
+                self._export_incremental(asst_data, triage, file_path, progress)
+            elif file_path.exists():
+                self._export_in_place(asst_data, triage, file_path, progress, parallel)
+            elif parallel:
+                self._export_parallel(asst_data, triage, file_path, progress)
+            else:
+                self._export_fast(asst_data, triage, file_path, progress)
+
+        trace.write(file_path.with_suffix('.trace.json'))
+
+        return output_dir if per_section and engine != 'legacy' else file_path
+
+    def _build_layouts(self, asst_data: Data, triage: CommentTriage, progress: Callable[[int], None] = None) -> dict[str, SheetLayout]:
+        layouts = {}
+        for i, (section, rows) in enumerate(asst_data.section_rows.items(), start=1):
+            layouts[section] = build_layout(section_table(asst_data, section), asst_data.name, triage.section(rows))
+
+            if progress:
+                progress(i)
+
+        return layouts
+
+    def _render_sections(self, render: Callable, asst_data: Data, triage: CommentTriage, progress: Callable[[int], None] = None) -> dict:
+        """render(section_data, title, triage) for every section, each in a worker process."""
+        sections = list(asst_data.section_rows)
+        results = {}
+
+        pool = self.pool()
+        futures = []
+        try:
+            for section, rows in asst_data.section_rows.items():
+                futures.append(pool.submit(render, section_table(asst_data, section), asst_data.name, triage.section(rows)))
+
+            for i, (section, future) in enumerate(zip(sections, futures), start=1):
+                results[section] = future.result()
+
+                if progress:
+                    progress(i)
+        except BaseException as e:
+            # Drop queued sections straight away if a progress callback aborted the export
+            for future in futures:
+                future.cancel()
+            if isinstance(e, BrokenProcessPool):
+                # A worker died; start a fresh pool on the next export
+                self.close()
+            raise
+
+        return results
+
+    def _export_fast(self, asst_data: Data, triage: CommentTriage, file_path: Path, progress: Callable[[int], None] = None):
+        # Writes a new workbook, so export only calls it when there is no existing one to keep sheets from
+        save_layouts(self._build_layouts(asst_data, triage, progress), file_path)
+
+    def _export_in_place(self, asst_data: Data, triage: CommentTriage, file_path: Path, progress: Callable[[int], None] = None,
+                         parallel: bool = False):
+        # Redraws every section's sheet and keeps all other sheets of the existing workbook
+        if parallel:
+            layouts = self._render_sections(build_layout, asst_data, triage, progress)
+        else:
+            layouts = self._build_layouts(asst_data, triage, progress)
+
+        output_wb = openpyxl.load_workbook(file_path)
+        for sheet_name, layout in layouts.items():
+            replace_sheet(output_wb, sheet_name, layout)
+        output_wb.save(file_path)
+
+    def _export_parallel(self, asst_data: Data, triage: CommentTriage, path: Path, progress: Callable[[int], None] = None,
+                         per_section: bool = False):
+        sheets = self._render_sections(render_section, asst_data, triage, progress)
+
+        if per_section:
+            for section, sheet_xml in sheets.items():
+                assemble_workbook({section: sheet_xml}, path / f'{section}.xlsx')
+        else:
+            assemble_workbook(sheets, path)
+
+    def _export_incremental(self, asst_data: Data, triage: CommentTriage, file_path: Path, progress: Callable[[int], None] = None):
+        digests_path = file_path.with_suffix('.digests.json')
+        recorded = load_digests(digests_path, file_path) if file_path.exists() else {}
+        recorded_sections, recorded_rows = recorded.get('sections', {}), recorded.get('rows', {})
+        digests, rows = {}, {}
+        changed, patched = {}, {}
+
+        for i, (section, section_rows) in enumerate(asst_data.section_rows.items(), start=1):
+            section_data = section_table(asst_data, section)
+            section_triage = triage.section(section_rows)
+            paste = section_triage.paste_block()
+            digests[section] = section_digest(section_data, asst_data.name, paste)
+            rows[section] = row_digests(section_data, asst_data.name, paste)
+
+            if recorded_sections.get(section) != digests[section]:
+                layout = build_layout(section_data, asst_data.name, section_triage)
+                # Same cadets in the same places: only the rows that changed are redrawn
+                positions = changed_rows(recorded_rows.get(section), rows[section])
+                if positions is None:
+                    changed[section] = layout
+                else:
+                    patched[section] = (layout, positions, recorded_rows[section]['comments'] != rows[section]['comments'])
+
+            if progress:
+                progress(i)
+
+        if not changed and not patched:
+            return
+
+        if file_path.exists():
+            output_wb = openpyxl.load_workbook(file_path)
+            for sheet_name, (layout, positions, comments) in patched.items():
+                if sheet_name in output_wb.sheetnames:
+                    patch_sheet(output_wb[sheet_name], layout, positions, comments)
+                else:
+                    changed[sheet_name] = layout
+            for sheet_name, layout in changed.items():
+                replace_sheet(output_wb, sheet_name, layout)
+            output_wb.save(file_path)
+        else:
+            save_layouts(changed, file_path)
+
+        # Sheets of sections missing from this export are left alone, so keep their digests
+        save_digests(digests_path, file_path, {**recorded_sections, **digests}, {**recorded_rows, **rows})
+
+    def _export_legacy(self, asst_data: Data, triage: CommentTriage, file_path: Path, progress: Callable[[int], None] = None):
+        if file_path.exists():
+            output_wb = openpyxl.load_workbook(file_path)
+        else:
+            output_wb = openpyxl.Workbook()
+        
+        for i, (section, rows) in enumerate(asst_data.section_rows.items(), start=1):
+
+            if output_wb.sheetnames[0] == 'Sheet':
+                ws = output_wb.active
+                ws.title = section
+            elif section in output_wb.sheetnames:
+                ws = output_wb[section]
+            else:
+                ws = output_wb.create_sheet(title=section)
+
+            self.generate_excel_table(section_table(asst_data, section), ws, asst_data.name, triage.section(rows))
+
+            if progress:
+                progress(i)
+        
+        output_wb.save(file_path)
+
+    def _pixel_to_pt(self, x):
+        return x / 7.0
+
+    def _truncate_string(self, s, max_length=20):
+        return s if len(s) <= max_length else s[:max_length] + '...'
+
+    def generate_excel_table(self, df: pd.DataFrame, ws, title: str, triage: CommentTriage = None):
+        # define fill colors
+        greenFill = PatternFill(start_color='FF00B050', end_color='FF00B050', fill_type='solid')
+        redFill = PatternFill(start_color='FFC00000', end_color='FFC00000', fill_type='solid')
+        borderFill = PatternFill(start_color='FF808080', end_color='FF808080', fill_type='solid')
+        headerFill = PatternFill(start_color='FFD9D9D9', end_color='FFD9D9D9', fill_type='solid')
+        whiteFill = PatternFill(start_color='FFFFFFFF', end_color='FFFFFFFF', fill_type='solid')
+        warningFill = PatternFill(start_color='FFF59412', end_color='FFF59412', fill_type='solid')
+
+        # Define border styles
+        thin_all_sides = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+        thin_bottom = Border(bottom=Side(style='thin'))
+        thin_bottom_sides = Border(left=Side(style='thin'), right=Side(style='thin'), bottom=Side(style='thin'))
+        thin_sides = Border(left=Side(style='thin'), right=Side(style='thin'))
+
+        if triage is None:
+            triage = self.comment_filter.triage(df.get('Comment'), df.get('Documentation'))
+
+        df = df.drop(['Email', 'Section'], axis=1, inplace=False).reset_index(drop=True)
+        question_cols = [col for col in df.columns if col.startswith('Q')]
+        n_questions = len(question_cols)
+        n_students = len(df)
+        documentation = 'Documentation' in df.columns
+        comment = 'Comment' in df.columns
+        last_col = 0
+        pasteLoc = None
+
+        center_align = Alignment(horizontal='center', vertical='center')
+        left_align_indent = Alignment(horizontal='left', vertical='center', indent=1)
+
+        # Set column widths
+        ws.column_dimensions['A'].width = self._pixel_to_pt(22)
+        ws.column_dimensions['B'].width = self._pixel_to_pt(200)
+        ws.column_dimensions['C'].width = self._pixel_to_pt(48)
+
+        for i in range(n_questions):
+            last_col = 4 + i
+            col = get_column_letter(last_col)
+            ws.column_dimensions[col].width = self._pixel_to_pt(30)
+        
+        if comment:
+            last_col += 1
+            col = get_column_letter(last_col)
+            ws.column_dimensions[col].width = self._pixel_to_pt(665)
+            pasteLoc = (col, len(df['Name']) + 8)
+
+        if documentation:
+            last_col += 1
+            col = get_column_letter(last_col)
+            ws.column_dimensions[col].width = self._pixel_to_pt(294)
+        
+        ws.column_dimensions[get_column_letter(last_col + 1)].width = self._pixel_to_pt(21)
+
+        # Set row heights
+        for i in range(1, n_students + 21):
+            ws.row_dimensions[i].height = 20
+
+        for col in range(1, len(df.columns) + 3):
+            for row in range(1, len(df['Name']) + 6):
+                ws[f'{get_column_letter(col)}{row}'].fill = borderFill
+
+        # Write Title
+        ws['B2'] = title.strip('"')
+        ws['B2'].fill = headerFill
+        ws['B2'].border = thin_all_sides
+        ws.merge_cells(f'B2:{get_column_letter(last_col)}2')
+        ws['B2'].alignment = center_align
+
+        # Write Headers
+        for i, title in enumerate(df.columns):
+            cell = f'{get_column_letter(2 + i)}4'
+            title = title if title != 'Comment' else 'What did you find interesting/useful/confusing?'
+            title = title if title != 'Documentation' else 'Documentation Statement'
+            ws[cell] = title
+            ws[cell].alignment = center_align if title.startswith(('Q', 'T')) else left_align_indent
+            ws[cell].fill = headerFill
+            ws[cell].border = thin_all_sides
+
+        # Write Student Data
+        for idx, student in df.iterrows():
+            col = 2
+            row = idx + 5
+
+            ws[f'{get_column_letter(col)}{row}'] = f'{student["Name"]}'
+            ws[f'{get_column_letter(col)}{row}'].alignment = left_align_indent
+            ws[f'{get_column_letter(col)}{row}'].fill = whiteFill
+            ws[f'{get_column_letter(col)}{row}'].border = thin_all_sides
+
+            col += 1
+            ws[f'{get_column_letter(col)}{row}'] = f'{student["Total"]}'
+            ws[f'{get_column_letter(col)}{row}'].alignment = center_align
+            ws[f'{get_column_letter(col)}{row}'].fill = whiteFill
+            ws[f'{get_column_letter(col)}{row}'].border = thin_all_sides
+
+            for i in range(n_questions):
+                col = 4 + i
+                cell = f'{get_column_letter(col)}{row}'
+                val = student[f'Q{i + 1}']
+                ws[cell] = val if val == '-' else ''
+                ws[cell].alignment = center_align
+                ws[cell].border = thin_all_sides
+                if val == 1:
+                    ws[cell].fill = greenFill
+                elif val == 0.5:
+                    ws[cell].fill = redFill
+                elif val == '-':
+                    ws[cell].fill = whiteFill
+                else:
+                    ws[cell].fill = warningFill
+            
+            if comment:
+                col += 1
+                ws[f'{get_column_letter(col)}{row}'] = triage.cells[idx]
+                ws[f'{get_column_letter(col)}{row}'].alignment = left_align_indent
+                ws[f'{get_column_letter(col)}{row}'].fill = whiteFill
+                ws[f'{get_column_letter(col)}{row}'].border = thin_all_sides
+
+            if documentation:
+                col += 1
+                ws[f'{get_column_letter(col)}{row}'] = triage.documentation_cells[idx]
+                ws[f'{get_column_letter(col)}{row}'].alignment = left_align_indent
+                ws[f'{get_column_letter(col)}{row}'].fill = whiteFill
+                ws[f'{get_column_letter(col)}{row}'].border = thin_all_sides
+
+        if pasteLoc:
+            allowed_comments = triage.paste_block()
+
+            col, row = pasteLoc
+
+            ws[f'{col}{row}'] = 'Copy and Paste Comments:'
+            ws[f'{col}{row}'].border = thin_bottom
+
+            for idx, student_comment in enumerate(allowed_comments):
+                ws[f'{col}{row + idx + 1}'] = student_comment
+                ws[f'{col}{row + idx + 1}'].border = thin_sides if idx != len(allowed_comments) - 1 else thin_bottom_sides
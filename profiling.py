@@ -0,0 +1,144 @@
+"""Per-stage timing of a grading run.
+
+Processor and the GUI wrap each stage (roster setup, parsing, the data view, export) in
+Trace.stage, which records wall time, row count and memory, logs the record, and keeps it
+for the JSON trace written next to the output workbook. Each run makes its own trace when it
+loads an assignment and passes it on to the export, so a trace only covers that assignment's
+stages, however many runs are in progress.
+
+Memory is the process's peak resident size unless a profile mode is selected:
+
+- 'tracemalloc' records the peak Python allocation of each stage above its starting point
+- 'cprofile' profiles each outermost stage and saves the combined stats beside the trace
+"""
+import cProfile
+import json
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+log = logging.getLogger(__name__)
+
+PROFILE_MODES = ('tracemalloc', 'cprofile')
+
+# Functions listed per stage in the JSON trace when profiling with cProfile
+PROFILE_TOP = 15
+
+def max_rss_bytes() -> int:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+@dataclass
+class StageRecord:
+    name: str
+    started: float
+    seconds: float = None
+    rows: int = None
+    peak_bytes: int = None
+    max_rss_bytes: int = None
+    profile: list[tuple[str, float]] = None
+    _peak: int = field(default=0, repr=False)
+
+    def to_json(self) -> dict:
+        record = asdict(self)
+        record.pop('_peak')
+        return {key: value for key, value in record.items() if value is not None}
+
+class Trace:
+    def __init__(self):
+        self.records: list[StageRecord] = []
+        self.stats: pstats.Stats = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name: str, mode: str = None):
+        """Time the enclosed block; set rows on the yielded record to report a row count."""
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f'Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}')
+
+        stack = self._local.__dict__.setdefault('stack', [])
+        record = StageRecord(name, time.time())
+
+        profiler = None
+        if mode == 'cprofile' and not stack:
+            profiler = cProfile.Profile()
+        if mode == 'tracemalloc':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing stage keeps the peak it reached before this one resets it
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, peak)
+            tracemalloc.reset_peak()
+            start_memory = current
+
+        stack.append(record)
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record.seconds = time.perf_counter() - start
+            stack.pop()
+
+            if mode == 'tracemalloc' and tracemalloc.is_tracing():
+                peak = max(record._peak, tracemalloc.get_traced_memory()[1])
+                record.peak_bytes = peak - start_memory
+                if stack:
+                    stack[-1]._peak = max(stack[-1]._peak, peak)
+            record.max_rss_bytes = max_rss_bytes()
+            if profiler:
+                self._add_profile(record, profiler)
+
+            self._finish(record)
+
+    def _add_profile(self, record: StageRecord, profiler: cProfile.Profile):
+        stats = pstats.Stats(profiler)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+        record.profile = [(pstats.func_std_string(func), round(timing[3], 6)) for func, timing in top]
+
+        with self._lock:
+            if self.stats is None:
+                self.stats = stats
+            else:
+                self.stats.add(stats)
+
+    def _finish(self, record: StageRecord):
+        rows = f', {record.rows} rows' if record.rows is not None else ''
+        memory = f', peak {record.peak_bytes / 2**20:.1f} MB' if record.peak_bytes is not None else ''
+        log.info('%s: %.3fs%s%s', record.name, record.seconds, rows, memory)
+
+        with self._lock:
+            self.records.append(record)
+
+    def write(self, file_path: Path):
+        """Write the records as JSON to file_path, and any cProfile stats to the matching .prof file."""
+        with self._lock:
+            records = [record.to_json() for record in self.records]
+            stats = self.stats
+
+        with open(file_path, 'w') as f:
+            json.dump({'stages': records}, f, indent=2)
+
+        profile_path = Path(file_path).with_suffix('.prof')
+        if stats is not None:
+            stats.dump_stats(profile_path)
+        else:
+            profile_path.unlink(missing_ok=True)
@@ -0,0 +1,416 @@
+"""Section sheet layout and the streaming ("fast") workbook writer.
+
+A section is first laid out as dense rows of (value, style name) cells, then streamed into
+a new workbook in one pass. Every cell gets a single shared style, created once per workbook,
+instead of separate fill, border and alignment assignments. XlsxWriter is used when it is
+installed, otherwise openpyxl's write-only mode.
+
+For parallel exports each section is rendered to worksheet XML on its own against the fixed
+STYLES table, and the parts are then zipped into one package by assemble_workbook.
+"""
+import re
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Alignment
+from openpyxl.styles.borders import Border, Side
+from openpyxl.utils.cell import get_column_letter
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+from comments import CommentFilter, CommentTriage
+
+
+ALL_SIDES = ('left', 'right', 'top', 'bottom')
+
+# Order is fixed: rendered worksheet XML refers to these styles by position (see STYLE_IDS)
+STYLES = {
+    'Cengage Border': dict(fill='808080'),
+    'Cengage Header Center': dict(fill='D9D9D9', border=ALL_SIDES, align='center'),
+    'Cengage Header Left': dict(fill='D9D9D9', border=ALL_SIDES, align='left'),
+    'Cengage Text': dict(fill='FFFFFF', border=ALL_SIDES, align='left'),
+    'Cengage Center': dict(fill='FFFFFF', border=ALL_SIDES, align='center'),
+    'Cengage Full Credit': dict(fill='00B050', border=ALL_SIDES, align='center'),
+    'Cengage Partial Credit': dict(fill='C00000', border=ALL_SIDES, align='center'),
+    'Cengage Warning': dict(fill='F59412', border=ALL_SIDES, align='center'),
+    'Cengage Paste Header': dict(border=('bottom',)),
+    'Cengage Paste': dict(border=('left', 'right')),
+    'Cengage Paste Last': dict(border=('left', 'right', 'bottom')),
+}
+
+# Cell style index 0 is the workbook default
+STYLE_IDS = {name: i for i, name in enumerate(STYLES, start=1)}
+
+BORDER = 'Cengage Border'
+MISSING = 'Cengage Center'
+
+HEADER_TITLES = {'Comment': 'What did you find interesting/useful/confusing?', 'Documentation': 'Documentation Statement'}
+
+ROW_HEIGHT = 20
+
+# Sheet row of a section's first student; the rows above hold the title and headers
+STUDENT_ROW = 5
+
+# Bump whenever build_layout changes what it draws, so incremental exports redraw every sheet
+LAYOUT_VERSION = 2
+
+
+@dataclass
+class SheetLayout:
+    """A rendered section: dense rows from row 1, each cell a (value, style name) pair or None."""
+    title: str
+    rows: list[list[tuple]] = field(default_factory=list)
+    column_pixels: list[int] = field(default_factory=list)
+    n_sized_rows: int = 0
+    n_students: int = 0
+    merged: list[tuple[int, int, int, int]] = field(default_factory=list)
+
+def pixel_to_pt(x):
+    return x / 7.0
+
+def openpyxl_style(name) -> NamedStyle:
+    spec = STYLES[name]
+    style = NamedStyle(name=name)
+
+    if 'fill' in spec:
+        style.fill = PatternFill(start_color=f'FF{spec["fill"]}', end_color=f'FF{spec["fill"]}', fill_type='solid')
+    if 'border' in spec:
+        style.border = Border(**{side: Side(style='thin') for side in spec['border']})
+    if spec.get('align') == 'center':
+        style.alignment = Alignment(horizontal='center', vertical='center')
+    elif spec.get('align') == 'left':
+        style.alignment = Alignment(horizontal='left', vertical='center', indent=1)
+
+    return style
+
+def xlsxwriter_format(wb, name):
+    spec = STYLES[name]
+    props = {}
+
+    if 'fill' in spec:
+        props.update(pattern=1, bg_color=f'#{spec["fill"]}')
+    for side in spec.get('border', ()):
+        props[side] = 1
+    if spec.get('align') == 'center':
+        props.update(align='center', valign='vcenter')
+    elif spec.get('align') == 'left':
+        props.update(align='left', valign='vcenter', indent=1)
+
+    return wb.add_format(props)
+
+def register_styles(wb):
+    for name in STYLES:
+        if name not in wb.named_styles:
+            wb.add_named_style(openpyxl_style(name))
+
+def question_styles(values: np.ndarray) -> np.ndarray:
+    """Style name per question cell, following the fill rules of the legacy engine."""
+    styles = np.full(values.shape, 'Cengage Warning', dtype=object)
+    styles[values == '-'] = MISSING
+    styles[values == 0.5] = 'Cengage Partial Credit'
+    styles[values == 1] = 'Cengage Full Credit'
+
+    return styles
+
+def build_layout(df: pd.DataFrame, title: str, triage: CommentTriage = None) -> SheetLayout:
+    """Lay out one section the same way Processor.generate_excel_table draws it.
+
+    triage is the section's slice of the assignment's comment triage; without it the
+    section's own comments are triaged with the default filter.
+    """
+    if triage is None:
+        triage = CommentFilter().triage(df.get('Comment'), df.get('Documentation'))
+
+    df = df.drop(['Email', 'Section'], axis=1, inplace=False).reset_index(drop=True)
+    question_cols = [col for col in df.columns if col.startswith('Q')]
+    n_questions = len(question_cols)
+    n_students = len(df)
+    comment = 'Comment' in df.columns
+    documentation = 'Documentation' in df.columns
+    last_col = 3 + n_questions + comment + documentation
+    layout = SheetLayout(title=title.strip('"'), n_sized_rows=n_students + 20, n_students=n_students)
+
+    # Column widths
+    layout.column_pixels = [22, 200, 48] + [30] * n_questions + [665] * comment + [294] * documentation + [21]
+
+    border = (None, BORDER)
+    grid = [border] * (last_col + 1)
+
+    # Title and headers
+    title_row = [border, (layout.title, 'Cengage Header Center')] + [border] * (last_col - 1)
+    headers = [HEADER_TITLES.get(col, col) for col in df.columns]
+    header_row = [border] + [(x, 'Cengage Header Center' if x.startswith(('Q', 'T')) else 'Cengage Header Left') for x in headers] + [border]
+    layout.rows = [grid, title_row, grid, header_row]
+    layout.merged.append((2, 2, 2, last_col))
+
+    # Student data, built column-wise then zipped into rows
+    columns = [
+        [(x, 'Cengage Text') for x in df['Name'].astype(str)],
+        [(x, 'Cengage Center') for x in df['Total'].astype(str)],
+    ]
+
+    values = df[question_cols].to_numpy(dtype=object)
+    styles = question_styles(values)
+    for i in range(n_questions):
+        columns.append([('-' if v == '-' else '', s) for v, s in zip(values[:, i], styles[:, i])])
+
+    if comment:
+        columns.append([(x, 'Cengage Text') for x in triage.cells])
+    if documentation:
+        columns.append([(x, 'Cengage Text') for x in triage.documentation_cells])
+
+    layout.rows.extend([border, *cells, border] for cells in zip(*columns))
+    layout.rows.append(grid)
+
+    # Copy and paste comment block, below the table in the comment column
+    if comment:
+        allowed_comments = triage.paste_block()
+        paste_col = 3 + n_questions
+        pad = [None] * paste_col
+
+        layout.rows.extend([[], []])
+        layout.rows.append(pad + [('Copy and Paste Comments:', 'Cengage Paste Header')])
+        for idx, student_comment in enumerate(allowed_comments):
+            layout.rows.append(pad + [(student_comment, 'Cengage Paste' if idx != len(allowed_comments) - 1 else 'Cengage Paste Last')])
+
+    return layout
+
+def stream_layout(ws, layout: SheetLayout):
+    """Append a layout to an openpyxl write-only worksheet."""
+    for i, width in enumerate(layout.column_pixels, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = pixel_to_pt(width)
+    for i in range(1, layout.n_sized_rows + 1):
+        ws.row_dimensions[i].height = ROW_HEIGHT
+    for first_row, first_col, last_row, last_col in layout.merged:
+        ws.merged_cells.add(f'{get_column_letter(first_col)}{first_row}:{get_column_letter(last_col)}{last_row}')
+
+    # Rows only carry their height if they are appended, so pad out to the sized range
+    rows = layout.rows + [[]] * (layout.n_sized_rows - len(layout.rows))
+
+    for row in rows:
+        cells = []
+        for cell in row:
+            if cell is None:
+                cells.append(None)
+                continue
+            value, style = cell
+            cell = WriteOnlyCell(ws, value)
+            cell.style = style
+            cells.append(cell)
+        ws.append(cells)
+
+def write_xlsxwriter_layout(ws, layout: SheetLayout, formats: dict):
+    """Write a layout to an XlsxWriter worksheet."""
+    for i, width in enumerate(layout.column_pixels):
+        ws.set_column_pixels(i, i, width)
+
+    merged = {(first_row, first_col): (last_row, last_col) for first_row, first_col, last_row, last_col in layout.merged}
+
+    for row_idx in range(layout.n_sized_rows):
+        ws.set_row(row_idx, ROW_HEIGHT)
+
+    for row_idx, row in enumerate(layout.rows):
+        for col_idx, cell in enumerate(row):
+            if cell is None:
+                continue
+            value, style = cell
+            span = merged.get((row_idx + 1, col_idx + 1))
+            if span:
+                ws.merge_range(row_idx, col_idx, span[0] - 1, span[1] - 1, value, formats[style])
+            elif value is None or value == '':
+                ws.write_blank(row_idx, col_idx, None, formats[style])
+            else:
+                ws.write_string(row_idx, col_idx, value, formats[style])
+
+def write_layout(ws, layout: SheetLayout):
+    """Write a layout cell by cell into a regular (loaded or new) openpyxl worksheet."""
+    register_styles(ws.parent)
+
+    for i, width in enumerate(layout.column_pixels, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = pixel_to_pt(width)
+    for i in range(1, layout.n_sized_rows + 1):
+        ws.row_dimensions[i].height = ROW_HEIGHT
+
+    for row_idx, row in enumerate(layout.rows, start=1):
+        write_row(ws, row_idx, row)
+
+    for first_row, first_col, last_row, last_col in layout.merged:
+        ws.merge_cells(start_row=first_row, start_column=first_col, end_row=last_row, end_column=last_col)
+
+def write_row(ws, row_idx: int, row: list[tuple]):
+    for col_idx, cell in enumerate(row, start=1):
+        if cell is None:
+            continue
+        value, style = cell
+        ws.cell(row=row_idx, column=col_idx, value=value).style = style
+
+def patch_sheet(ws, layout: SheetLayout, students: list[int], comments: bool = False):
+    """Redraw the given student rows of a sheet previously drawn with the same cadets in the same order.
+
+    The comment block below the table is redrawn as well when comments is set, since its
+    length can change with the comments.
+    """
+    register_styles(ws.parent)
+
+    for i in students:
+        write_row(ws, STUDENT_ROW + i, layout.rows[STUDENT_ROW - 1 + i])
+
+    if comments:
+        # Everything below the closing border row belongs to the comment block
+        first_row = STUDENT_ROW + layout.n_students + 1
+        if ws.max_row >= first_row:
+            ws.delete_rows(first_row, ws.max_row - first_row + 1)
+        for row_idx, row in enumerate(layout.rows[first_row - 1:], start=first_row):
+            write_row(ws, row_idx, row)
+
+def replace_sheet(wb, sheet_name: str, layout: SheetLayout):
+    """Redraw a sheet from scratch in place, so no cells from its previous contents survive."""
+    if sheet_name in wb.sheetnames:
+        index = wb.sheetnames.index(sheet_name)
+        wb.remove(wb[sheet_name])
+        ws = wb.create_sheet(title=sheet_name, index=index)
+    else:
+        ws = wb.create_sheet(title=sheet_name)
+
+    write_layout(ws, layout)
+
+def save_layouts(layouts: dict[str, SheetLayout], file_path: Path):
+    """Write a new workbook with one sheet per layout in a single streaming pass."""
+    if xlsxwriter is not None:
+        wb = xlsxwriter.Workbook(str(file_path))
+        formats = {name: xlsxwriter_format(wb, name) for name in STYLES}
+
+        for sheet_name, layout in layouts.items():
+            write_xlsxwriter_layout(wb.add_worksheet(sheet_name), layout, formats)
+
+        wb.close()
+        return
+
+    wb = openpyxl.Workbook(write_only=True)
+    register_styles(wb)
+
+    for sheet_name, layout in layouts.items():
+        stream_layout(wb.create_sheet(title=sheet_name), layout)
+
+    wb.save(file_path)
+
+# Raw worksheet XML rendering, used by the parallel exporter
+
+_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _xml_text(value) -> str:
+    return escape(_ILLEGAL_XML_CHARS.sub('', f'{value}'))
+
+def render_sheet_xml(layout: SheetLayout) -> bytes:
+    """Serialize a layout to a standalone worksheet part that only depends on STYLES."""
+    parts = [_XML_DECLARATION, f'<worksheet xmlns="{_MAIN_NS}"><sheetFormatPr defaultRowHeight="15"/><cols>']
+
+    for i, width in enumerate(layout.column_pixels, start=1):
+        parts.append(f'<col min="{i}" max="{i}" width="{pixel_to_pt(width)}" customWidth="1"/>')
+    parts.append('</cols><sheetData>')
+
+    letters = [get_column_letter(i) for i in range(1, max(map(len, layout.rows), default=0) + 1)]
+    for row_idx in range(1, max(len(layout.rows), layout.n_sized_rows) + 1):
+        row = layout.rows[row_idx - 1] if row_idx <= len(layout.rows) else []
+        height = f' ht="{ROW_HEIGHT}" customHeight="1"' if row_idx <= layout.n_sized_rows else ''
+        parts.append(f'<row r="{row_idx}"{height}>')
+
+        for col_idx, cell in enumerate(row):
+            if cell is None:
+                continue
+            value, style = cell
+            ref = f'{letters[col_idx]}{row_idx}'
+            if value is None or value == '':
+                parts.append(f'<c r="{ref}" s="{STYLE_IDS[style]}"/>')
+            else:
+                parts.append(f'<c r="{ref}" s="{STYLE_IDS[style]}" t="inlineStr"><is><t xml:space="preserve">{_xml_text(value)}</t></is></c>')
+
+        parts.append('</row>')
+    parts.append('</sheetData>')
+
+    if layout.merged:
+        parts.append(f'<mergeCells count="{len(layout.merged)}">')
+        for first_row, first_col, last_row, last_col in layout.merged:
+            parts.append(f'<mergeCell ref="{get_column_letter(first_col)}{first_row}:{get_column_letter(last_col)}{last_row}"/>')
+        parts.append('</mergeCells>')
+
+    parts.append('</worksheet>')
+
+    return ''.join(parts).encode('utf-8')
+
+def render_section(section_data: pd.DataFrame, title: str, triage: CommentTriage = None) -> bytes:
+    """Lay out and serialize one section; runs in a worker process."""
+    return render_sheet_xml(build_layout(section_data, title, triage))
+
+def _styles_xml() -> str:
+    fills = ['<fill><patternFill patternType="none"/></fill>', '<fill><patternFill patternType="gray125"/></fill>']
+    borders = ['<border><left/><right/><top/><bottom/><diagonal/></border>']
+    xfs = ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>']
+
+    for spec in STYLES.values():
+        fill_id = 0
+        if 'fill' in spec:
+            fill_id = len(fills)
+            fills.append(f'<fill><patternFill patternType="solid"><fgColor rgb="FF{spec["fill"]}"/><bgColor rgb="FF{spec["fill"]}"/></patternFill></fill>')
+
+        border_id = 0
+        if 'border' in spec:
+            border_id = len(borders)
+            sides = ''.join(f'<{side} style="thin"><color indexed="64"/></{side}>' if side in spec['border'] else f'<{side}/>' for side in ALL_SIDES)
+            borders.append(f'<border>{sides}<diagonal/></border>')
+
+        alignment = ''
+        if spec.get('align') == 'center':
+            alignment = '<alignment horizontal="center" vertical="center"/>'
+        elif spec.get('align') == 'left':
+            alignment = '<alignment horizontal="left" vertical="center" indent="1"/>'
+
+        xfs.append(f'<xf numFmtId="0" fontId="0" fillId="{fill_id}" borderId="{border_id}" xfId="0" applyFill="{int(bool(fill_id))}" '
+                   f'applyBorder="{int(bool(border_id))}" applyAlignment="{int(bool(alignment))}">{alignment}</xf>')
+
+    return (f'{_XML_DECLARATION}<styleSheet xmlns="{_MAIN_NS}">'
+            '<fonts count="1"><font><sz val="11"/><name val="Calibri"/><family val="2"/><scheme val="minor"/></font></fonts>'
+            f'<fills count="{len(fills)}">{"".join(fills)}</fills>'
+            f'<borders count="{len(borders)}">{"".join(borders)}</borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            f'<cellXfs count="{len(xfs)}">{"".join(xfs)}</cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            '</styleSheet>')
+
+def assemble_workbook(sheets: dict[str, bytes], file_path: Path):
+    """Package rendered worksheet parts, in order, into a single workbook."""
+    n = len(sheets)
+    content_types = ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                            for i in range(1, n + 1))
+    sheet_entries = ''.join(f'<sheet name={quoteattr(name)} sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(sheets, start=1))
+    sheet_rels = ''.join(f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, n + 1))
+
+    with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as package:
+        package.writestr('[Content_Types].xml', f'{_XML_DECLARATION}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/>'
+                         '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                         '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                         f'{content_types}</Types>')
+        package.writestr('_rels/.rels', f'{_XML_DECLARATION}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        package.writestr('xl/workbook.xml', f'{_XML_DECLARATION}<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>{sheet_entries}</sheets></workbook>')
+        package.writestr('xl/_rels/workbook.xml.rels', f'{_XML_DECLARATION}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         f'{sheet_rels}<Relationship Id="rId{n + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/></Relationships>')
+        package.writestr('xl/styles.xml', _styles_xml())
+
+        for i, sheet_xml in enumerate(sheets.values(), start=1):
+            package.writestr(f'xl/worksheets/sheet{i}.xml', sheet_xml)
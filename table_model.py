@@ -0,0 +1,134 @@
+"""Table model behind the GUI's data view.
+
+The model reads cells straight from the column arrays of a parsed assignment, so the view
+only ever touches the rows on screen. Sorting and section filtering reorder an index array
+with NumPy instead of going through a QSortFilterProxyModel, which would call data() for
+every row on each change.
+"""
+import numpy as np
+import pandas as pd
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QColor
+
+from processing import OUTCOME_MISSING, OUTCOME_FULL, OUTCOME_PARTIAL, OUTCOME_ANOMALOUS, OUTCOME_VALUES, Data
+from sheets import STYLES, MISSING
+
+# Rows handed to the view per fetchMore call
+FETCH_BATCH = 500
+
+# Question cell fills, matching the styles the Excel export uses for each outcome
+OUTCOME_STYLES = {
+    OUTCOME_MISSING: MISSING,
+    OUTCOME_FULL: 'Cengage Full Credit',
+    OUTCOME_PARTIAL: 'Cengage Partial Credit',
+    OUTCOME_ANOMALOUS: 'Cengage Warning',
+}
+
+def format_cell(value) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, (float, np.floating)):
+        return f'{value:g}'
+    return str(value)
+
+class AssignmentTableModel(QAbstractTableModel):
+    def __init__(self, asst_data: Data, parent=None):
+        super().__init__(parent)
+        df = asst_data.final_data
+        self.headers = list(df.columns)
+        self.columns = [df[col].to_numpy() for col in df.columns]
+        for header, values in (('Comment', asst_data.comments), ('Documentation', asst_data.documentations)):
+            if values is not None:
+                self.headers.append(header)
+                self.columns.append(values)
+        self.section_rows = asst_data.section_rows
+
+        # Question columns show the exported cell value, sort by raw score and are colored by outcome code
+        n_graded = sum(col.startswith('Q') for col in self.headers)
+        self.first_question = self.headers.index('Q1') if n_graded else len(self.headers)
+        self.outcomes = asst_data.outcomes[:, :n_graded]
+        self.scores = asst_data.scores[:, :n_graded]
+        self.brushes = {code: QColor(f'#{STYLES[style]["fill"]}') for code, style in OUTCOME_STYLES.items()}
+
+        self.section = None
+        self.sort_column, self.sort_order = None, Qt.AscendingOrder
+        self.rows = np.arange(len(df))
+        self.fetched = min(FETCH_BATCH, len(self.rows))
+
+    def section_names(self) -> list[str]:
+        return sorted(self.section_rows)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.fetched < len(self.rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(FETCH_BATCH, len(self.rows) - self.fetched)
+        self.beginInsertRows(QModelIndex(), self.fetched, self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = self.rows[index.row()], index.column()
+        question = col - self.first_question
+
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            if 0 <= question < self.outcomes.shape[1]:
+                code = self.outcomes[row, question]
+                return format_cell(self.scores[row, question] if code == OUTCOME_ANOMALOUS else OUTCOME_VALUES[code])
+            return format_cell(self.columns[col][row])
+        if role == Qt.BackgroundRole and 0 <= question < self.outcomes.shape[1]:
+            return self.brushes[self.outcomes[row, question]]
+        if role == Qt.TextAlignmentRole and self.headers[col] not in ('Name', 'Email', 'Comment', 'Documentation'):
+            return Qt.AlignCenter
+
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return str(self.rows[section] + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column, self.sort_order = column, order
+        self.layoutAboutToBeChanged.emit()
+        self.rows = self._ordered(self.rows)
+        self.layoutChanged.emit()
+
+    def set_section(self, section=None):
+        """Show only the rows of one section, or every row when section is None."""
+        self.beginResetModel()
+        self.section = section
+        # Sections are contiguous row ranges of the parsed data
+        section_rows = slice(None) if section is None else self.section_rows[section]
+        rows = np.arange(len(self.columns[0]))[section_rows]
+        self.rows = self._ordered(rows)
+        self.fetched = min(FETCH_BATCH, len(self.rows))
+        self.endResetModel()
+
+    def _ordered(self, rows: np.ndarray) -> np.ndarray:
+        if self.sort_column is None or self.sort_column < 0:
+            return rows
+
+        question = self.sort_column - self.first_question
+        if 0 <= question < self.scores.shape[1]:
+            keys = pd.Series(self.scores[rows, question])
+        else:
+            keys = pd.Series(self.columns[self.sort_column][rows])
+            if keys.dtype == object:
+                keys = keys.astype(str).str.lower()
+
+        ascending = self.sort_order == Qt.AscendingOrder
+        order = keys.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+        return rows[order]
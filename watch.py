@@ -0,0 +1,127 @@
+"""Watching a folder for new or updated Cengage exports.
+
+FolderWatcher polls the folder's *.csv files. A file is offered once its size and
+modification time have held still for `settle` seconds, so downloads still being written
+are left alone. Offered files are then fingerprinted by content, and only those whose
+digest differs from the one recorded when they were last processed are loaded and
+exported. The digests are kept in a JSON state file, so restarting the watch does not
+reprocess the folder.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from cache import file_digest
+from gradebook import Gradebook
+from processing import Processor
+from profiling import Trace
+
+log = logging.getLogger(__name__)
+
+# Written to the output root, next to the assignment folders it tracks
+WATCH_STATE = 'watch.json'
+
+class FolderWatcher:
+    def __init__(self, directory, state_path, settle: float = 2.0, pattern='*.csv'):
+        self.directory = Path(directory)
+        self.state_path = Path(state_path)
+        self.settle = settle
+        self.pattern = pattern
+        # path -> ((size, mtime_ns), when that signature was first seen)
+        self._seen: dict[Path, tuple[tuple[int, int], float]] = {}
+        # path -> signature already handed out by settled()
+        self._offered: dict[Path, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self.digests = self._load_state()
+
+    def _load_state(self) -> dict[str, str]:
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _key(self, path: Path) -> str:
+        return str(path.resolve())
+
+    def settled(self, now: float = None) -> list[Path]:
+        """Files that appeared or changed and have since held still for settle seconds."""
+        now = time.monotonic() if now is None else now
+        ready = []
+        present = set()
+
+        for path in sorted(self.directory.glob(self.pattern)):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            present.add(path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+
+            seen = self._seen.get(path)
+            if seen is None or seen[0] != signature:
+                self._seen[path] = (signature, now)
+            elif now - seen[1] >= self.settle and self._offered.get(path) != signature:
+                self._offered[path] = signature
+                ready.append(path)
+
+        for path in set(self._seen) - present:
+            del self._seen[path]
+            self._offered.pop(path, None)
+
+        return ready
+
+    def release(self, paths: list[Path]):
+        """Offer paths again on the next poll, for files handed out but never processed."""
+        for path in paths:
+            self._offered.pop(path, None)
+
+    def changed(self, path: Path) -> str:
+        """The content digest of path, or None if it matches the digest last recorded for it."""
+        digest = file_digest(path)
+        with self._lock:
+            return None if self.digests.get(self._key(path)) == digest else digest
+
+    def record(self, path: Path, digest: str):
+        with self._lock:
+            self.digests[self._key(path)] = digest
+            state = dict(self.digests)
+
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+def process_ready(processor: Processor, watcher: FolderWatcher, paths: list[Path], output_root='output', gradebook: Gradebook = None,
+                  progress: Callable[[int], None] = None, **export_options) -> list[tuple[Path, Path]]:
+    """Load and export each path whose content changed, returning (export, workbook) pairs.
+
+    A file that fails is logged and left until it changes again; the others still run.
+    """
+    results = []
+    for i, file_path in enumerate(paths):
+        if progress:
+            progress(i)
+
+        try:
+            digest = watcher.changed(file_path)
+            if digest is None:
+                log.info('%s: unchanged, skipped', file_path)
+                continue
+
+            trace = Trace()
+            asst_data = processor.load_file(file_path, trace=trace)
+            if gradebook:
+                with processor.stage('gradebook', trace):
+                    gradebook.append(asst_data)
+            results.append((file_path, processor.export(asst_data, output_root, trace=trace, **export_options)))
+            watcher.record(file_path, digest)
+        except Exception as e:
+            log.warning('%s: failed (%s)', file_path, e)
+
+    return results